@@ -2,10 +2,18 @@
 # Authors: Christian Smith; John Azariah
 # All rights reserved.
 
+import copyreg
+import operator
+import threading
 from types import NoneType
+from weakref import WeakValueDictionary
 from typing import TypeVar, _GenericAlias
 from abc import ABCMeta
 
+# The specialized classes in use, keyed by their generic class and type arguments
+_specializations = WeakValueDictionary()
+_specializations_lock = threading.Lock()
+
 
 # Define a custom metaclass to handle type annotations
 class TypeAnnotatedMeta(ABCMeta):
@@ -41,6 +49,18 @@ class TypeAnnotatedMeta(ABCMeta):
             if not isinstance(typ, (type, TypeVar, _GenericAlias, NoneType)):
                 raise TypeError(f"Type annotations must be types, not {type(typ).__name__}")
 
+        with _specializations_lock:
+            if (specialization := _specializations.get((cls, types))) is None:
+                specialization = _specializations[(cls, types)] = cls._specialize(types)
+        return specialization
+
+    def _specialize(cls, types):
+        """Create the subclass of `cls` specialized with `types`.
+
+        Specializations are cached, so that repeatedly subscribing a class with the same types returns the identical class
+        for as long as it is in use. The cache only holds weak references, so that specializations which are no longer used
+        (e.g. with dynamically created types) are freed rather than leaked.
+        """
         # Dynamically create a new subclass with class-level properties for type parameters
         type_var_names = [tvar.__name__ for tvar in cls.__parameters__]
 
@@ -50,6 +70,7 @@ class TypeAnnotatedMeta(ABCMeta):
         # Create the Annotated class dynamically
         class Annotated(cls):
             __type_parameters__ = dict(zip(type_var_names, types))
+            __specialization__ = (cls, types)  # used to reconstruct this class when it is unpickled
 
             # Dynamically add class-level properties for each type parameter
             for name, value in zip(type_var_names, types):
@@ -77,3 +98,16 @@ class TypeAnnotatedMeta(ABCMeta):
         """
         if not cls.__type_params__:
             raise TypeError(f"{cls.__name__} must be specialized with concrete types.")
+
+
+def _reduce_type_annotated_class(cls):
+    """Pickle specialized classes by re-specializing their generic class, and all other classes by reference."""
+    match cls.__dict__.get("__specialization__"):
+        case (generic_class, types):
+            return operator.getitem, (generic_class, types)
+        case _:
+            return cls.__qualname__
+
+
+# Dynamically specialized classes cannot be found by name, so teach `pickle` how to rebuild them (e.g. in worker processes)
+copyreg.pickle(TypeAnnotatedMeta, _reduce_type_annotated_class)
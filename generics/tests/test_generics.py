@@ -2,14 +2,17 @@
 # Authors: Christian Smith; John Azariah
 # All rights reserved.
 
+import gc
 import pytest
+import pickle
+from dataclasses import dataclass
 from typing import Generic, TypeVar
 from abc import ABC, abstractmethod
 
 import sys
 import pathlib
 sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
-from generics.generics import TypeAnnotatedMeta
+from generics.generics import TypeAnnotatedMeta, _specializations
 
 # Define TypeVars for use with Generic
 T = TypeVar("T")
@@ -215,3 +218,82 @@ def test_generic_subclass_with_generic_base():
     assert SubClass[int, int].U == int
     assert BaseClass[int, int].T == int
     assert BaseClass[int, int].U == int
+
+
+@dataclass
+class PicklableGeneric(Generic[T, U], metaclass=TypeAnnotatedMeta):
+    value: int = 0
+
+
+def test_specialized_class_can_be_pickled():
+    Specialized = PicklableGeneric[int, str]
+    Unpickled = pickle.loads(pickle.dumps(Specialized))
+
+    assert Unpickled.T is int
+    assert Unpickled.U is str
+    assert issubclass(Unpickled, PicklableGeneric)
+
+
+def test_specialized_instance_can_be_pickled():
+    instance = PicklableGeneric[float, bool](value=42)
+    unpickled = pickle.loads(pickle.dumps(instance))
+
+    assert unpickled.value == 42
+    assert unpickled.T is float
+    assert unpickled.U is bool
+    assert isinstance(unpickled, PicklableGeneric)
+
+
+def test_unspecialized_class_is_pickled_by_reference():
+    assert pickle.loads(pickle.dumps(PicklableGeneric)) is PicklableGeneric
+
+
+def test_specializations_are_cached():
+    class MyClass(Generic[T, U], metaclass=TypeAnnotatedMeta):
+        pass
+
+    assert MyClass[int, str] is MyClass[int, str]
+    assert MyClass[int, str] is not MyClass[str, int]
+    assert MyClass[int, str]().T is int
+
+
+def test_specializations_of_different_classes_are_distinct():
+    class MyClass(Generic[T], metaclass=TypeAnnotatedMeta):
+        pass
+
+    class MyOtherClass(Generic[T], metaclass=TypeAnnotatedMeta):
+        pass
+
+    assert MyClass[int] is not MyOtherClass[int]
+    assert issubclass(MyOtherClass[int], MyOtherClass)
+
+
+def test_specializations_in_use_stay_identical():
+    class MyClass(Generic[T], metaclass=TypeAnnotatedMeta):
+        pass
+
+    specialization = MyClass[int]
+    for i in range(2000):
+        MyClass[type(f"Dynamic{i}", (), {})]
+
+    assert MyClass[int] is specialization
+
+
+def test_unused_specializations_are_freed():
+    class MyClass(Generic[T], metaclass=TypeAnnotatedMeta):
+        pass
+
+    for i in range(100):
+        MyClass[type(f"Dynamic{i}", (), {})]
+    gc.collect()
+
+    assert not [key for key in list(_specializations.keys()) if key[0] is MyClass]
+
+
+def test_invalid_specializations_are_not_cached():
+    class MyClass(Generic[T, U], metaclass=TypeAnnotatedMeta):
+        pass
+
+    for _ in range(2):
+        with pytest.raises(TypeError, match="Number of type arguments must match the number of type parameters"):
+            MyClass[int]
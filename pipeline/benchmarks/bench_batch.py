@@ -0,0 +1,50 @@
+# Copyright (c) 2024 Contributors
+# Authors: Christian Smith; John Azariah
+# All rights reserved.
+
+"""Benchmark per-item `transform` against batched `transform_batch` on small numeric items.
+
+Run with `python benchmarks/bench_batch.py` from the `pipeline` folder.
+"""
+
+import sys
+import pathlib
+import time
+from collections.abc import Iterable, Sequence
+from dataclasses import dataclass
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent.parent / "generics"))
+from pipeline.pipeline import Pipeline, BatchPipeline, PipelineStage
+
+ITEM_COUNT = 200_000
+BATCH_SIZES = [16, 256, 4096]
+
+
+@dataclass
+class RangeStage(PipelineStage[int, int]):
+    def transform(self, input: int) -> Iterable[int]:
+        return range(input)
+
+
+@dataclass
+class ScaleStage(PipelineStage[int, float]):
+    def transform(self, input: int) -> Iterable[float]:
+        return [input * 0.5 + 1.0]
+
+    def transform_batch(self, inputs: Sequence[int]) -> Sequence[float]:
+        return [input * 0.5 + 1.0 for input in inputs]
+
+
+def per_item_cost(pipeline: Pipeline[int, float]) -> float:
+    start = time.perf_counter()
+    pipeline.run(ITEM_COUNT)
+    return (time.perf_counter() - start) / ITEM_COUNT
+
+
+if __name__ == "__main__":
+    stages = [RangeStage(), ScaleStage()]
+    print(f"{'per item':>16}: {per_item_cost(Pipeline[int, float](stages)) * 1e9:8.1f} ns per item")
+    for batch_size in BATCH_SIZES:
+        cost = per_item_cost(BatchPipeline[int, float](stages, batch_size=batch_size))
+        print(f"{f'batches of {batch_size}':>16}: {cost * 1e9:8.1f} ns per item")
@@ -0,0 +1,79 @@
+# Copyright (c) 2024 Contributors
+# Authors: Christian Smith; John Azariah
+# All rights reserved.
+
+"""Benchmark the codecs used by `FileSystemCoupledPipeline` to store intermediate results.
+
+For each codec, measures the encode and decode throughput of a batch of records, and their footprint on disk
+when stored one per file and in segments.
+
+Run with `python benchmarks/bench_codecs.py` from the `pipeline` folder.
+"""
+
+import sys
+import pathlib
+import tempfile
+import time
+from dataclasses import dataclass
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent.parent / "generics"))
+from pipeline.pipeline import Pipeline, PipelineStage, to_filename
+from pipeline.filesystem_coupled_pipeline import FileSystemCoupledPipeline
+from pipeline.serialization import get_codec
+
+RECORD_COUNT = 5_000
+CODECS = ["json", "msgpack", "json+zlib", "msgpack+zlib"]
+
+
+@to_filename(lambda document: f"{document.id}")
+@dataclass
+class Document:
+    id: int
+    title: str
+    tags: list[str]
+    scores: list[float]
+
+
+RECORDS = [
+    Document(id=i, title=f"document number {i}", tags=["alpha", "beta", "gamma"][: i % 4], scores=[i / 7, i / 11, i / 13])
+    for i in range(RECORD_COUNT)
+]
+
+
+@dataclass
+class ProduceDocuments(PipelineStage[None, Document]):
+    def produce(self) -> list[Document]:
+        return RECORDS
+
+
+def throughput(name: str) -> tuple[float, float]:
+    """Returns the number of records encoded, and decoded, per second."""
+    codec = get_codec(name)
+    start = time.perf_counter()
+    encoded = [codec.encode(record) for record in RECORDS]
+    encode_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for content in encoded:
+        codec.decode(content, Document)
+    decode_time = time.perf_counter() - start
+    return RECORD_COUNT / encode_time, RECORD_COUNT / decode_time
+
+
+def footprint(name: str, layout: str) -> int:
+    """Returns the number of bytes written to disk for all the records."""
+    with tempfile.TemporaryDirectory() as document_root:
+        pipeline = Pipeline[None, Document]([ProduceDocuments()])
+        FileSystemCoupledPipeline(document_root=document_root, pipeline=pipeline, codec=name, layout=layout).run()
+        return sum(path.stat().st_size for path in pathlib.Path(document_root, "stage_1").iterdir())
+
+
+if __name__ == "__main__":
+    print(f"{'codec':>15} {'encode (rec/s)':>16} {'decode (rec/s)':>16} {'files (KiB)':>12} {'segments (KiB)':>15}")
+    for name in CODECS:
+        encode_rate, decode_rate = throughput(name)
+        print(
+            f"{name:>15} {encode_rate:>16,.0f} {decode_rate:>16,.0f}"
+            f" {footprint(name, 'files') / 1024:>12,.0f} {footprint(name, 'segments') / 1024:>15,.0f}"
+        )
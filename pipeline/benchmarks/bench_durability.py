@@ -0,0 +1,50 @@
+# Copyright (c) 2024 Contributors
+# Authors: Christian Smith; John Azariah
+# All rights reserved.
+
+"""Benchmark the cost of the durability policies of `FileWriter`.
+
+Every policy writes files atomically (through a temporary file and a rename); they differ in when files are synced to disk.
+
+Run with `python benchmarks/bench_durability.py` from the `pipeline` folder.
+"""
+
+import sys
+import pathlib
+import tempfile
+import time
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent.parent / "generics"))
+from pipeline.file_writer import FileWriter
+
+FILE_COUNT = 1_000
+CONTENT = b'{"id": 1, "value": "' + b"x" * 1_000 + b'"}'
+# (label, durability, group size): a durability of None writes files directly, without a `FileWriter`
+POLICIES = [("plain open/write", None, 0), ("none", "none", 0), ("group of 64", "group", 64), ("file", "file", 0)]
+
+
+def write_files(folder: pathlib.Path, durability: str | None, group_size: int) -> None:
+    if durability is None:
+        for i in range(FILE_COUNT):
+            with open(folder / f"{i}.json", "wb") as f:
+                f.write(CONTENT)
+        return
+
+    writer = FileWriter(durability=durability, group_size=group_size)
+    for i in range(FILE_COUNT):
+        writer.write(str(folder / f"{i}.json"), CONTENT)
+    writer.close()
+
+
+def files_per_second(durability: str | None, group_size: int) -> float:
+    with tempfile.TemporaryDirectory() as folder:
+        start = time.perf_counter()
+        write_files(pathlib.Path(folder), durability, group_size)
+        return FILE_COUNT / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    print(f"{'durability':>18} {'files/s':>12}")
+    for label, durability, group_size in POLICIES:
+        print(f"{label:>18} {files_per_second(durability, group_size):>12,.0f}")
@@ -0,0 +1,52 @@
+# Copyright (c) 2024 Contributors
+# Authors: Christian Smith; John Azariah
+# All rights reserved.
+
+"""Benchmark the throughput of a chain of pure 1:1 stages, with and without fusion by `Pipeline.compile`.
+
+Run with `python benchmarks/bench_fusion.py` from the `pipeline` folder.
+"""
+
+import sys
+import pathlib
+import time
+from collections.abc import Iterable
+from dataclasses import dataclass
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent.parent / "generics"))
+from pipeline.pipeline import Pipeline, PipelineStage
+
+ITEM_COUNT = 100_000
+CHAIN_LENGTH = 10
+
+
+@dataclass
+class RangeStage(PipelineStage[int, int]):
+    def transform(self, input: int) -> Iterable[int]:
+        return range(input)
+
+
+@dataclass
+class AddOneStage(PipelineStage[int, int]):
+    pure = True
+
+    def transform_one(self, input: int) -> int:
+        return input + 1
+
+    def transform(self, input: int) -> Iterable[int]:
+        return [input + 1]
+
+
+def throughput(pipeline: Pipeline[int, int]) -> float:
+    start = time.perf_counter()
+    pipeline.run(ITEM_COUNT)
+    return ITEM_COUNT / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    pipeline = Pipeline[int, int]([RangeStage()] + [AddOneStage() for _ in range(CHAIN_LENGTH)])
+    unfused, fused = throughput(pipeline), throughput(pipeline.compile())
+    print(f"{CHAIN_LENGTH} chained stages")
+    print(f"{'unfused':>8}: {unfused:12,.0f} items/s")
+    print(f"{'fused':>8}: {fused:12,.0f} items/s ({fused / unfused:.1f}x)")
@@ -0,0 +1,54 @@
+# Copyright (c) 2024 Contributors
+# Authors: Christian Smith; John Azariah
+# All rights reserved.
+
+"""Benchmark the per-item cost of a stage that both produces and transforms.
+
+`produce` is invoked once per run of a stage, so the per-item cost of the stage should stay flat as the producer grows.
+
+Run with `python benchmarks/bench_produce.py` from the `pipeline` folder.
+"""
+
+import sys
+import pathlib
+import time
+from collections.abc import Iterable
+from dataclasses import dataclass
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent.parent / "generics"))
+from pipeline.pipeline import Pipeline, PipelineStage
+
+ITEM_COUNT = 2_000
+PRODUCER_SIZES = [10, 100, 1_000, 10_000]
+
+
+@dataclass
+class FanOutStage(PipelineStage[int, int]):
+    def transform(self, input: int) -> Iterable[int]:
+        return range(input)
+
+
+@dataclass
+class ScanningStage(PipelineStage[int, int]):
+    producer_size: int
+
+    def produce(self) -> Iterable[int]:
+        # stands in for an expensive scan of some external resource
+        return [sum(range(self.producer_size))]
+
+    def transform(self, input: int) -> Iterable[int]:
+        return [input * 2]
+
+
+def per_item_cost(producer_size: int) -> float:
+    pipeline = Pipeline[int, int]([FanOutStage(), ScanningStage(producer_size=producer_size)])
+    start = time.perf_counter()
+    pipeline.run(ITEM_COUNT)
+    return (time.perf_counter() - start) / ITEM_COUNT
+
+
+if __name__ == "__main__":
+    print(f"{'producer size':>15} {'per-item cost (us)':>20}")
+    for producer_size in PRODUCER_SIZES:
+        print(f"{producer_size:>15} {per_item_cost(producer_size) * 1e6:>20.3f}")
@@ -0,0 +1,70 @@
+# Copyright (c) 2024 Contributors
+# Authors: Christian Smith; John Azariah
+# All rights reserved.
+
+"""Benchmark the "pretty" and "fast" modes of `WriteJsonToFile`.
+
+Measures the cost of serializing records alone, and of writing them to files, for msgspec Structs and dataclasses.
+
+Run with `python benchmarks/bench_write_json.py` from the `pipeline` folder.
+"""
+
+import sys
+import pathlib
+import tempfile
+import time
+from dataclasses import dataclass
+from msgspec import Struct
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent.parent / "generics"))
+from pipeline.library import WriteJsonToFile
+
+RECORD_COUNT = 2_000
+
+
+class StructRecord(Struct):
+    id: int
+    title: str
+    tags: list[str]
+    scores: list[float]
+
+
+@dataclass
+class DataclassRecord:
+    id: int
+    title: str
+    tags: list[str]
+    scores: list[float]
+
+
+class WriteRecords(WriteJsonToFile):
+    def get_filename(self, input) -> str:
+        return str(input.id)
+
+
+def records(record_type: type) -> list:
+    return [record_type(id=i, title=f"record number {i}", tags=["alpha", "beta"], scores=[i / 7, i / 11]) for i in range(RECORD_COUNT)]
+
+
+def records_per_second(mode: str, record_type: type, write: bool) -> float:
+    inputs = records(record_type)
+    with tempfile.TemporaryDirectory() as folder:
+        stage = WriteRecords(target_directory=folder, mode=mode)
+        start = time.perf_counter()
+        for input in inputs:
+            if write:
+                stage.consume(input)
+            else:
+                stage.to_json(input)
+        return RECORD_COUNT / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    print(f"{'mode':>8} {'record type':>16} {'serialize (rec/s)':>18} {'write (rec/s)':>14}")
+    for mode in ["pretty", "fast"]:
+        for record_type in [StructRecord, DataclassRecord]:
+            print(
+                f"{mode:>8} {record_type.__name__:>16}"
+                f" {records_per_second(mode, record_type, write=False):>18,.0f} {records_per_second(mode, record_type, write=True):>14,.0f}"
+            )
@@ -1,11 +1,19 @@
-from .pipeline import PipelineStage, Pipeline, IdentityStage, to_filename
+from .pipeline import PipelineStage, Pipeline, StreamingPipeline, BatchPipeline, IdentityStage, FusedStage, fuse, to_filename
 from .pipeline import PipelineStageEnhancer, EnhancedPipeline
+from .concurrent_pipeline import ThreadPoolPipeline, ProcessPoolPipeline, StageParallelPipeline
+from .async_pipeline import AsyncPipelineStage, AsyncPipeline
+from .caching import CachedStage, MemoryCache, DirectoryCache, SQLiteCache, memoize, memoized_stage
+from .serialization import Codec, JsonCodec, MsgpackCodec, CompressedCodec, get_codec
 from .filesystem_coupled_pipeline import FileSystemEnhancer, FileSystemCoupledPipeline, FileSystemContext
 from .library import WriteJsonToFile, FormatPrintToConsole
 
 __all__ = [
-    "PipelineStage", "Pipeline", "IdentityStage", "to_filename",
+    "PipelineStage", "Pipeline", "StreamingPipeline", "BatchPipeline", "IdentityStage", "FusedStage", "fuse", "to_filename",
     "PipelineStageEnhancer", "EnhancedPipeline",
+    "ThreadPoolPipeline", "ProcessPoolPipeline", "StageParallelPipeline",
+    "AsyncPipelineStage", "AsyncPipeline",
+    "CachedStage", "MemoryCache", "DirectoryCache", "SQLiteCache", "memoize", "memoized_stage",
+    "Codec", "JsonCodec", "MsgpackCodec", "CompressedCodec", "get_codec",
     "FileSystemEnhancer", "FileSystemCoupledPipeline", "FileSystemContext",
     "WriteJsonToFile", "FormatPrintToConsole"
 ]
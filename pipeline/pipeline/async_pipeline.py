@@ -0,0 +1,202 @@
+# Copyright (c) 2024 Contributors
+# Authors: Christian Smith; John Azariah
+# All rights reserved.
+
+import asyncio
+import inspect
+from dataclasses import dataclass
+from typing import Generic, Any
+from collections.abc import Iterable, AsyncIterable, AsyncIterator
+
+from generics import TypeAnnotatedMeta
+
+from .pipeline import Pipeline, PipelineStage, StageFailure, TStageInput, TStageResult, TPipelineInput, TPipelineResult
+
+# Marks the end of the stream of items flowing through a queue
+END = object()
+
+
+async def iterate(results: Any) -> AsyncIterator[Any]:
+    """Iterate over the value returned by `produce` or `transform`, which may be an (async) iterable, or an awaitable of one."""
+    if inspect.isawaitable(results):
+        results = await results
+    if results is None:
+        return
+
+    if isinstance(results, AsyncIterable):
+        async for result in results:
+            yield result
+    else:
+        for result in results:
+            yield result
+
+
+@dataclass
+class AsyncPipelineStage(Generic[TStageInput, TStageResult], metaclass=TypeAnnotatedMeta):
+    """This is a base class for a pipeline stage whose methods may be `async`.
+
+    `produce` and `transform` may be coroutine functions returning an iterable, or async generators.
+    `consume` may be a coroutine function or a regular function.
+
+    Attributes:
+        concurrency (int | None):
+            The maximum number of inputs this stage transforms at the same time.
+            Defaults to the `concurrency` of the `AsyncPipeline` running the stage.
+    """
+    concurrency = None
+
+    async def produce(self) -> AsyncIterable[TStageResult]:
+        return []
+
+    async def transform(self, input: TStageInput) -> AsyncIterable[TStageResult]:
+        return []
+
+    async def consume(self, result: TStageResult) -> None:
+        return
+
+    async def _consume(self, result: TStageResult) -> None:
+        if self.consume and inspect.isawaitable(consumed := self.consume(result)):
+            await consumed
+
+    async def source(self) -> AsyncIterator[TStageResult]:
+        """Yield (and consume) the results of `produce`."""
+        async for result in iterate(self.produce() if self.produce else []):
+            await self._consume(result)
+            yield result
+
+    async def apply(self, input: TStageInput, passthrough: bool = True) -> AsyncIterator[TStageResult]:
+        """Yield (and consume) the results of `transform` on a single input, passing the input through if there are none."""
+        empty = True
+        async for result in iterate(self.transform(input) if self.transform else []):
+            empty = False
+            await self._consume(result)
+            yield result
+
+        if empty and passthrough:
+            await self._consume(input)
+            yield input
+
+    async def run(self, input: TStageInput) -> list[TStageResult]:
+        produce_results = [result async for result in self.source()]
+        return produce_results + [result async for result in self.apply(input, passthrough=not produce_results)]
+
+    def __call__(self, input: TStageInput):
+        return self.run(input)
+
+
+async def source(stage: AsyncPipelineStage[Any, Any] | PipelineStage[Any, Any]) -> list[Any]:
+    """Collect the results of `produce`, running synchronous stages on a worker thread."""
+    if isinstance(stage, AsyncPipelineStage):
+        return [result async for result in stage.source()]
+    return await asyncio.to_thread(lambda: list(stage.source()))
+
+
+async def apply(stage: AsyncPipelineStage[Any, Any] | PipelineStage[Any, Any], input: Any, passthrough: bool) -> list[Any]:
+    """Collect the results of `transform` on a single input, running synchronous stages on a worker thread."""
+    if isinstance(stage, AsyncPipelineStage):
+        return [result async for result in stage.apply(input, passthrough)]
+    return await asyncio.to_thread(lambda: list(stage.apply(input, passthrough)))
+
+
+def first_exception(exception: BaseException) -> BaseException:
+    while isinstance(exception, BaseExceptionGroup):
+        exception = exception.exceptions[0]
+    return exception
+
+
+class AsyncPipeline(Pipeline[TPipelineInput, TPipelineResult]):
+    """A pipeline which runs its stages concurrently on an `asyncio` event loop.
+
+    Each stage runs as its own task, and results stream between stages through bounded `asyncio.Queue`s.
+    Within a stage, up to `concurrency` inputs are transformed at the same time.
+
+    Stages may be `AsyncPipelineStage`s or regular `PipelineStage`s; the methods of the latter are run on worker threads via `asyncio.to_thread`.
+
+    Attributes:
+        concurrency (int):
+            The default maximum number of inputs transformed at the same time by each stage.
+        queue_size (int):
+            The maximum number of results waiting between two stages.
+        ordered (bool):
+            If set (the default), the results of each stage are in the same order as its inputs.
+            Otherwise, results are passed on in the order in which they complete.
+    """
+    def __init__(
+        self,
+        stages: Iterable[AsyncPipelineStage[Any, Any] | PipelineStage[Any, Any]] = None,
+        concurrency: int = 8,
+        queue_size: int = 64,
+        ordered: bool = True
+    ):
+        super().__init__(stages)
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.ordered = ordered
+
+    async def run_stage(self, stage: AsyncPipelineStage[Any, Any] | PipelineStage[Any, Any], inbox: asyncio.Queue, outbox: asyncio.Queue) -> None:
+        concurrency = getattr(stage, "concurrency", None) or self.concurrency
+        semaphore = asyncio.Semaphore(concurrency)
+        pending = asyncio.Queue(maxsize=concurrency)
+
+        async def apply_one(input: Any, passthrough: bool) -> list[Any]:
+            try:
+                return await apply(stage, input, passthrough)
+            finally:
+                semaphore.release()
+
+        async def apply_and_put(input: Any, passthrough: bool) -> None:
+            for result in await apply_one(input, passthrough):
+                await outbox.put(result)
+
+        async def collect_in_order() -> None:
+            while (task := await pending.get()) is not END:
+                for result in await task:
+                    await outbox.put(result)
+
+        try:
+            produce_results = await source(stage)
+            for result in produce_results:
+                await outbox.put(result)
+            passthrough = not produce_results
+
+            async with asyncio.TaskGroup() as group:
+                if self.ordered:
+                    group.create_task(collect_in_order())
+
+                while (input := await inbox.get()) is not END and not isinstance(input, StageFailure):
+                    await semaphore.acquire()
+                    if self.ordered:
+                        await pending.put(group.create_task(apply_one(input, passthrough)))
+                    else:
+                        group.create_task(apply_and_put(input, passthrough))
+
+                if self.ordered:
+                    await pending.put(END)
+
+            await outbox.put(input)
+        except Exception as e:
+            await outbox.put(StageFailure(first_exception(e)))
+
+    async def stream(self, input: TPipelineInput) -> AsyncIterator[TPipelineResult]:
+        """Asynchronously yield the results of the pipeline as they emerge from the last stage."""
+        queues = [asyncio.Queue(maxsize=self.queue_size) for _ in range(len(self.stages) + 1)]
+        tasks = [
+            asyncio.create_task(self.run_stage(stage, inbox, outbox))
+            for stage, inbox, outbox in zip(self.stages, queues, queues[1:])
+        ]
+
+        try:
+            await queues[0].put(input)
+            await queues[0].put(END)
+
+            while (result := await queues[-1].get()) is not END:
+                if isinstance(result, StageFailure):
+                    raise result.exception
+                yield result
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def run(self, input: TPipelineInput) -> list[TPipelineResult]:
+        return [result async for result in self.stream(input)]
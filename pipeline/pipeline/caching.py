@@ -0,0 +1,288 @@
+# Copyright (c) 2024 Contributors
+# Authors: Christian Smith; John Azariah
+# All rights reserved.
+
+import dataclasses
+import hashlib
+import os
+import sqlite3
+import threading
+import msgspec
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import wraps
+from typing import Any
+from collections.abc import Callable, Iterable
+
+from .file_writer import FileWriter
+from .pipeline import PipelineStage, TStageInput, TStageResult
+from .serialization import msgpack_decoder
+
+msgpack_encoder = msgspec.msgpack.Encoder()
+
+
+@dataclass
+class CacheStats:
+    """Counts the lookups in a `ResultCache`, to help tune it."""
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+class ResultCache(ABC):
+    """A cache of the (MessagePack encoded) results of `transform`, keyed by a hash of the stage and of its input.
+
+    Subclasses implement `load` and `store`; `get` and `put` keep the statistics up to date.
+    Caches are copied into the worker processes of a `ProcessPoolPipeline`, each copy keeping its own statistics.
+
+    Attributes:
+        stats (CacheStats):
+            The number of hits, misses and evictions of the cache.
+    """
+    stats: CacheStats
+
+    @abstractmethod
+    def load(self, key: str) -> bytes | None:
+        pass
+
+    @abstractmethod
+    def store(self, key: str, value: bytes) -> None:
+        pass
+
+    def get(self, key: str) -> bytes | None:
+        value = self.load(key)
+        with self.lock:
+            if value is None:
+                self.stats.misses += 1
+            else:
+                self.stats.hits += 1
+        return value
+
+    def put(self, key: str, value: bytes) -> None:
+        self.store(key, value)
+
+    def __getstate__(self):
+        # locks (and open connections) are specific to the process using the cache
+        state = dict(self.__dict__)
+        del state["lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+
+class MemoryCache(ResultCache):
+    """Keeps results in memory, evicting the least recently used ones once they take more than `max_bytes`."""
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.stats = CacheStats()
+        self.entries = OrderedDict()
+        self.size = 0
+        self.__setstate__({})
+
+    def load(self, key: str) -> bytes | None:
+        with self.lock:
+            if (value := self.entries.get(key)) is not None:
+                self.entries.move_to_end(key)
+            return value
+
+    def store(self, key: str, value: bytes) -> None:
+        if len(value) > self.max_bytes:
+            return
+        with self.lock:
+            if (previous := self.entries.pop(key, None)) is not None:
+                self.size -= len(previous)
+            self.entries[key] = value
+            self.size += len(value)
+            while self.size > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= len(evicted)
+                self.stats.evictions += 1
+
+
+class DirectoryCache(ResultCache):
+    """Keeps results in files under `folder`, so that they are shared between processes and kept across runs.
+
+    Each result is written atomically, into one of 256 subfolders named after the first two characters of its key.
+    Nothing is ever evicted: delete the folder (or some of its files) to reclaim space.
+    """
+    def __init__(self, folder: str):
+        self.folder = folder
+        self.stats = CacheStats()
+        self.__setstate__({})
+
+    def __setstate__(self, state):
+        super().__setstate__(state)
+        self.file_writer = FileWriter(folder=self.folder)
+        self.subfolders = set()
+
+    def __getstate__(self):
+        state = super().__getstate__()
+        del state["file_writer"], state["subfolders"]
+        return state
+
+    def path(self, key: str) -> str:
+        return os.path.join(key[:2], key)
+
+    def load(self, key: str) -> bytes | None:
+        try:
+            with open(os.path.join(self.folder, self.path(key)), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def store(self, key: str, value: bytes) -> None:
+        if key[:2] not in self.subfolders:
+            os.makedirs(os.path.join(self.folder, key[:2]), exist_ok=True)
+            self.subfolders.add(key[:2])
+        self.file_writer.write(self.path(key), value)
+
+
+class SQLiteCache(ResultCache):
+    """Keeps results in the SQLite database at `path`, so that they are shared between processes and kept across runs.
+
+    Each thread uses its own connection; the database is put in WAL mode so that readers do not block the writer.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.stats = CacheStats()
+        self.__setstate__({})
+        with self.connection() as connection:
+            connection.execute("CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value BLOB NOT NULL)")
+
+    def __setstate__(self, state):
+        super().__setstate__(state)
+        self.connections = threading.local()
+
+    def __getstate__(self):
+        state = super().__getstate__()
+        del state["connections"]
+        return state
+
+    def connection(self) -> sqlite3.Connection:
+        if (connection := getattr(self.connections, "connection", None)) is None:
+            connection = self.connections.connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+        return connection
+
+    def load(self, key: str) -> bytes | None:
+        row = self.connection().execute("SELECT value FROM results WHERE key = ?", (key,)).fetchone()
+        return row[0] if row is not None else None
+
+    def store(self, key: str, value: bytes) -> None:
+        with self.connection() as connection:
+            connection.execute("INSERT OR REPLACE INTO results (key, value) VALUES (?, ?)", (key, value))
+
+
+def type_name(type_: Any) -> str:
+    """A name identifying a type across processes, including the type arguments of specialized generic classes."""
+    match getattr(type_, "__dict__", {}).get("__specialization__"):
+        case (generic_class, types):
+            return f"{type_name(generic_class)}[{', '.join(type_name(argument) for argument in types)}]"
+    if isinstance(type_, type):
+        return f"{type_.__module__}.{type_.__qualname__}"
+    return repr(type_)
+
+
+def stage_fingerprint(stage: PipelineStage[Any, Any], version: str = "") -> bytes:
+    """Describe what a stage computes: its type, its attributes, its `cache_version` and the given version.
+
+    The attributes of the stage are encoded with msgspec, except for the dataclass fields declared with `field(compare=False)`,
+    which are meant for state that does not configure the stage (e.g. counters). Stages with attributes which cannot be
+    encoded (e.g. callables or locks) cannot be described, so their results cannot be cached.
+    """
+    excluded = {field.name for field in dataclasses.fields(stage) if not field.compare} if dataclasses.is_dataclass(stage) else set()
+    attributes = {name: value for name, value in sorted(vars(stage).items()) if name not in excluded}
+    try:
+        encoded_attributes = msgpack_encoder.encode(attributes)
+    except (TypeError, ValueError) as e:
+        raise TypeError(
+            f"The results of {type_name(type(stage))} cannot be cached, as its attributes cannot be encoded ({e}). "
+            "Declare the fields which do not configure the stage with `field(compare=False)`."
+        ) from e
+    cache_version = getattr(stage, "cache_version", "")
+    return b"\0".join([type_name(type(stage)).encode(), encoded_attributes, cache_version.encode(), version.encode()])
+
+
+def cache_key(fingerprint: bytes, input: Any) -> str:
+    """Hash the fingerprint of a stage and its MessagePack encoded input."""
+    digest = hashlib.blake2b(fingerprint)
+    digest.update(msgpack_encoder.encode(input))
+    return digest.hexdigest()
+
+
+def cached_transform(
+    stage: PipelineStage[Any, Any], transform: Callable[[Any], Iterable[Any]], cache: ResultCache, fingerprint: bytes, input: Any
+) -> list[Any]:
+    """Return the cached results of `transform` on the input, calling it (and caching its results) on a miss."""
+    key = cache_key(fingerprint, input)
+    if (cached := cache.get(key)) is not None:
+        return msgpack_decoder(list[stage.TStageResult]).decode(cached)
+
+    results = list(transform(input) or [])
+    cache.put(key, msgpack_encoder.encode(results))
+    return results
+
+
+@dataclass
+class CachedStage(PipelineStage[TStageInput, TStageResult]):
+    """Wraps a deterministic stage, caching the results of its `transform` so that it is called once for each distinct input.
+
+    Inputs and results must be encodable by msgspec. Inputs are identified by their encoding, together with the stage as
+    described by `stage_fingerprint` when it is wrapped, and `version`: change it whenever the logic of `transform` changes,
+    so that results cached by earlier versions are ignored. The `produce` and `consume` methods of the stage are used unchanged.
+
+    Attributes:
+        stage (PipelineStage):
+            The stage whose results are cached.
+        cache (ResultCache):
+            Where results are cached: a `MemoryCache`, `DirectoryCache` or `SQLiteCache`.
+        version (str):
+            The version of the logic of the stage.
+    """
+    stage: PipelineStage[TStageInput, TStageResult]
+    cache: ResultCache
+    version: str = ""
+
+    def __post_init__(self):
+        self.produce = self.stage.produce
+        self.consume = self.stage.consume
+        # the stage is described once, so that the state it updates as it runs does not change the keys of its results
+        self.cache_fingerprint = stage_fingerprint(self.stage, self.version)
+
+    def transform(self, input: TStageInput) -> Iterable[TStageResult]:
+        return cached_transform(self.stage, self.stage.transform, self.cache, self.cache_fingerprint, input)
+
+
+def memoize(stage: PipelineStage[Any, Any], cache: ResultCache | None = None, version: str = "") -> CachedStage[Any, Any]:
+    """Wrap a stage in a `CachedStage`, caching its results in a `MemoryCache` unless another cache is given."""
+    return CachedStage[stage.TStageInput, stage.TStageResult](stage, cache if cache is not None else MemoryCache(), version)
+
+
+def memoized_stage(cache: ResultCache | None = None, version: str = ""):
+    """Use this decorator to cache the results of `transform` for every instance of a stage class, as `CachedStage` does.
+
+    The cache (a `MemoryCache` unless another cache is given) is available as the `result_cache` attribute of the class.
+    Each instance (including instances of subclasses) is described by `stage_fingerprint` when it first transforms an input.
+    """
+    def decorator(cls):
+        original_transform = cls.transform
+
+        @wraps(original_transform)
+        def transform(self, input):
+            # rather than in `__init__`, which subclasses (and `dataclass`, if applied after this decorator) replace
+            if (fingerprint := self.__dict__.get("cache_fingerprint")) is None:
+                fingerprint = self.cache_fingerprint = stage_fingerprint(self, version)
+            return cached_transform(self, original_transform.__get__(self), cls.result_cache, fingerprint, input)
+
+        cls.result_cache = cache if cache is not None else MemoryCache()
+        cls.transform = transform
+        return cls
+    return decorator
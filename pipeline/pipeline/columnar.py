@@ -0,0 +1,92 @@
+# Copyright (c) 2024 Contributors
+# Authors: Christian Smith; John Azariah
+# All rights reserved.
+
+import dataclasses
+import msgspec
+import numpy as np
+from dataclasses import dataclass
+from typing import Generic, TypeVar, Any
+from collections.abc import Iterable, Sequence
+
+from generics import TypeAnnotatedMeta
+
+from .pipeline import PipelineStage
+
+TRecord = TypeVar('TRecord')
+
+
+def field_names(record_type: type) -> tuple[str, ...]:
+    """Returns the names of the fields of a dataclass or `msgspec.Struct` type."""
+    if dataclasses.is_dataclass(record_type):
+        return tuple(field.name for field in dataclasses.fields(record_type))
+    if isinstance(record_type, type) and issubclass(record_type, msgspec.Struct):
+        return record_type.__struct_fields__
+    raise TypeError(f"Columnar batches can only hold dataclasses or msgspec Structs, not {record_type}.")
+
+
+class ColumnarBatch(Generic[TRecord], metaclass=TypeAnnotatedMeta):
+    """A batch of records of type `TRecord`, stored as a struct of arrays: one NumPy array for each field of `TRecord`.
+
+    Specializations such as `ColumnarBatch[Reading]` can be used as the input and result types of pipeline stages,
+    so that whole blocks of columns flow between stages which process them with vectorized kernels.
+
+    Attributes:
+        columns (dict[str, np.ndarray]):
+            The arrays holding the values of each field, all of the same length.
+    """
+    def __init__(self, columns: dict[str, Any]):
+        self.columns = {name: np.asarray(column) for name, column in columns.items()}
+        if len({len(column) for column in self.columns.values()}) > 1:
+            raise ValueError(f"All the columns of a {type(self).__name__} must have the same length.")
+
+    @classmethod
+    def from_records(cls, records: Sequence[TRecord]) -> "ColumnarBatch[TRecord]":
+        """Build a batch from a sequence of records, with one column for each field of `TRecord`."""
+        return cls({name: [getattr(record, name) for record in records] for name in field_names(cls.TRecord)})
+
+    @classmethod
+    def concatenate(cls, batches: Iterable["ColumnarBatch[TRecord]"]) -> "ColumnarBatch[TRecord]":
+        """Build a batch by concatenating the columns of a number of batches."""
+        batches = list(batches)
+        if not batches:
+            return cls.from_records([])
+        return cls({name: np.concatenate([batch.columns[name] for batch in batches]) for name in batches[0].columns})
+
+    def to_records(self) -> list[TRecord]:
+        """Convert the batch back into a list of records."""
+        names = field_names(self.TRecord)
+        values = [self.columns[name].tolist() for name in names]
+        return [self.TRecord(**dict(zip(names, row))) for row in zip(*values)]
+
+    def __len__(self) -> int:
+        return len(next(iter(self.columns.values()), ()))
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self.columns[name]
+
+
+def to_columns(record_type: type) -> PipelineStage[Any, Any]:
+    """Create a stage which converts records of type `record_type` into a `ColumnarBatch[record_type]`.
+
+    When run in a `BatchPipeline`, each batch of records becomes a single columnar batch.
+    """
+    @dataclass
+    class ToColumnsStage(PipelineStage[record_type, ColumnarBatch[record_type]]):
+        def transform(self, input: record_type) -> Iterable[ColumnarBatch[record_type]]:
+            return [ColumnarBatch[record_type].from_records([input])]
+
+        def transform_batch(self, inputs: Sequence[record_type]) -> Sequence[ColumnarBatch[record_type]]:
+            return [ColumnarBatch[record_type].from_records(inputs)]
+
+    return ToColumnsStage()
+
+
+def from_columns(record_type: type) -> PipelineStage[Any, Any]:
+    """Create a stage which converts each `ColumnarBatch[record_type]` back into records of type `record_type`."""
+    @dataclass
+    class FromColumnsStage(PipelineStage[ColumnarBatch[record_type], record_type]):
+        def transform(self, input: ColumnarBatch[record_type]) -> Iterable[record_type]:
+            return input.to_records()
+
+    return FromColumnsStage()
@@ -0,0 +1,337 @@
+# Copyright (c) 2024 Contributors
+# Authors: Christian Smith; John Azariah
+# All rights reserved.
+
+import msgspec
+import multiprocessing
+import queue
+import threading
+import time
+from dataclasses import dataclass
+from functools import partial
+from multiprocessing.context import BaseContext
+from multiprocessing.reduction import ForkingPickler
+from typing import Any
+from collections.abc import Iterable, Iterator
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
+
+from .pipeline import Pipeline, PipelineStage, StageFailure, TPipelineInput, TPipelineResult, chunked, map_on_executor
+from .serialization import msgpack_decoder
+
+# How often (in seconds) a blocked stage worker checks whether the pipeline has been stopped
+POLL_INTERVAL = 0.1
+
+# How long (in seconds) a stopped pipeline waits for its worker processes to end, before terminating them
+SHUTDOWN_TIMEOUT = 5
+
+msgpack_encoder = msgspec.msgpack.Encoder()
+
+
+def apply_to_chunk(stage: PipelineStage[Any, Any], passthrough: bool, chunk: bytes) -> bytes:
+    """Decode a chunk of inputs, apply the stage to each of them, and encode the list of results of each input.
+
+    This is run in the worker processes of a `ProcessPoolPipeline`.
+    """
+    inputs = msgpack_decoder(list[stage.TStageInput]).decode(chunk)
+    return msgpack_encoder.encode([list(stage.apply(input, passthrough)) for input in inputs])
+
+
+class ThreadPoolPipeline(Pipeline[TPipelineInput, TPipelineResult]):
+    """A pipeline which maps each stage across its inputs on a thread pool.
+
+    This is useful when the `transform` of a stage is I/O-bound (network calls, file reads, etc.).
+    The inputs of a stage are transformed concurrently, but each stage still completes before the next one starts.
+
+    Note that `consume` is called from the worker threads, so it must be thread-safe.
+
+    Attributes:
+        max_workers (int | None):
+            The number of worker threads. Defaults to the `concurrent.futures.ThreadPoolExecutor` default.
+        ordered (bool):
+            If set (the default), the results of each stage are in the same order as its inputs.
+            Otherwise, results are collected in the order in which they complete.
+    """
+    def __init__(self, stages: Iterable[PipelineStage[Any, Any]] = None, max_workers: int | None = None, ordered: bool = True):
+        super().__init__(stages)
+        self.max_workers = max_workers
+        self.ordered = ordered
+
+    def run(self, input: TPipelineInput) -> list[TPipelineResult]:
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            results = [input]
+            for stage in self.stages:
+                results = list(stage.process(results, executor=executor, ordered=self.ordered))
+
+        return results
+
+    def stream(self, input: TPipelineInput) -> Iterator[TPipelineResult]:
+        """Lazily yield the results of the pipeline, with the stages chained as in `Pipeline.stream`, each transforming its inputs on the thread pool."""
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            results = iter([input])
+            for stage in self.stages:
+                results = stage.process(results, executor=executor, ordered=self.ordered)
+            yield from results
+
+
+class ProcessPoolPipeline(Pipeline[TPipelineInput, TPipelineResult]):
+    """A pipeline which maps each stage across its inputs on a process pool.
+
+    This is useful when the `transform` of a stage is CPU-bound, and would otherwise be serialized by the GIL.
+    Inputs are shipped to the worker processes in chunks, to amortize the cost of inter-process communication.
+    Chunks of inputs and results are serialized with MessagePack (via `msgspec`), so they must be types that `msgspec` supports.
+    The stages themselves are pickled, so they must be picklable; stages specialized at runtime (e.g. `MyStage[int, str]()`) are supported.
+
+    Note that `consume` is called in the worker processes, so its side effects are not visible to the calling process.
+
+    Attributes:
+        max_workers (int | None):
+            The number of worker processes. Defaults to the `concurrent.futures.ProcessPoolExecutor` default.
+        chunk_size (int):
+            The number of inputs shipped to a worker process at a time.
+        ordered (bool):
+            If set (the default), the results of each stage are in the same order as its inputs.
+            Otherwise, the results of each chunk are collected in the order in which they complete.
+        mp_context (multiprocessing.context.BaseContext | None):
+            The multiprocessing context used to start the worker processes.
+    """
+    def __init__(
+        self,
+        stages: Iterable[PipelineStage[Any, Any]] = None,
+        max_workers: int | None = None,
+        chunk_size: int = 256,
+        ordered: bool = True,
+        mp_context: BaseContext | None = None
+    ):
+        super().__init__(stages)
+        self.max_workers = max_workers
+        self.chunk_size = chunk_size
+        self.ordered = ordered
+        self.mp_context = mp_context
+
+    def process_stage(self, stage: PipelineStage[Any, Any], inputs: Iterable[Any], executor: Executor) -> Iterator[Any]:
+        produced = False
+        for result in stage.source():
+            produced = True
+            yield result
+
+        chunks = (msgpack_encoder.encode(chunk) for chunk in chunked(inputs, self.chunk_size))
+        results_decoder = msgpack_decoder(list[list[stage.TStageResult]])
+        for chunk_results in map_on_executor(partial(apply_to_chunk, stage, not produced), chunks, executor, ordered=self.ordered):
+            for results in results_decoder.decode(chunk_results):
+                yield from results
+
+    def run(self, input: TPipelineInput) -> list[TPipelineResult]:
+        with ProcessPoolExecutor(max_workers=self.max_workers, mp_context=self.mp_context) as executor:
+            results = [input]
+            for stage in self.stages:
+                results = list(self.process_stage(stage, results, executor))
+
+        return results
+
+    def stream(self, input: TPipelineInput) -> Iterator[TPipelineResult]:
+        """Lazily yield the results of the pipeline, with the stages chained as in `Pipeline.stream`, each transforming its inputs on the process pool."""
+        with ProcessPoolExecutor(max_workers=self.max_workers, mp_context=self.mp_context) as executor:
+            results = iter([input])
+            for stage in self.stages:
+                results = self.process_stage(stage, results, executor)
+            yield from results
+
+
+@dataclass
+class EndOfStream:
+    """Marks the end of the stream of items flowing through a queue. (A class rather than a sentinel object, so it survives pickling.)"""
+    pass
+
+
+class Stopped(Exception):
+    """Raised in a stage worker when the pipeline has been stopped."""
+    pass
+
+
+class PicklingQueue:
+    """Wraps a multiprocessing queue, pickling items in `put` rather than on the queue's background feeder thread.
+
+    The feeder thread only prints the errors it raises, so an item which cannot be pickled would otherwise be silently dropped.
+    """
+    def __init__(self, queue: Any):
+        self.queue = queue
+
+    def put(self, item: Any, timeout: float | None = None) -> None:
+        self.queue.put(bytes(ForkingPickler.dumps(item)), timeout=timeout)
+
+    def get(self, timeout: float | None = None) -> Any:
+        return ForkingPickler.loads(self.queue.get(timeout=timeout))
+
+    def discard(self) -> None:
+        """Discard the items waiting in the queue, without unpickling them."""
+        try:
+            while True:
+                self.queue.get_nowait()
+        except queue.Empty:
+            pass
+
+    def cancel_join_thread(self) -> None:
+        self.queue.cancel_join_thread()
+
+
+def put(outbox: Any, item: Any, stopped: Any) -> None:
+    """Put `item` on a bounded queue, blocking while it is full, unless the pipeline is stopped."""
+    while True:
+        try:
+            return outbox.put(item, timeout=POLL_INTERVAL)
+        except queue.Full:
+            if stopped.is_set():
+                raise Stopped()
+
+
+def get(inbox: Any, stopped: Any) -> Any:
+    """Get an item from a queue, blocking while it is empty, unless the pipeline is stopped."""
+    while True:
+        try:
+            return inbox.get(timeout=POLL_INTERVAL)
+        except queue.Empty:
+            if stopped.is_set():
+                raise Stopped()
+
+
+def get_result(outbox: Any, workers: list[Any]) -> Any:
+    """Get an item from the queue of results of the last stage, raising if a worker ended without passing on the end of the stream."""
+    while True:
+        try:
+            return outbox.get(timeout=POLL_INTERVAL)
+        except queue.Empty:
+            pass
+
+        for w in workers:
+            if getattr(w, "exitcode", None) not in (None, 0):
+                raise RuntimeError(f"A stage worker ended unexpectedly, with exit code {w.exitcode}.")
+        if not any(w.is_alive() for w in workers):
+            # the items put by the workers before they ended may still be on their way
+            try:
+                return outbox.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                raise RuntimeError("The stage workers ended without passing on the end of the stream.") from None
+
+
+def run_stage_worker(stage: PipelineStage[Any, Any], inbox: Any, outbox: Any, stopped: Any) -> None:
+    """Run a stage over the items arriving in `inbox`, putting its results in `outbox`.
+
+    This is run on a dedicated thread or process for each stage of a `StageParallelPipeline`.
+    """
+    upstream_failure = None
+
+    def inputs() -> Iterator[Any]:
+        nonlocal upstream_failure
+        while not isinstance(item := get(inbox, stopped), EndOfStream):
+            if isinstance(item, StageFailure):
+                upstream_failure = item
+                return
+            yield item
+
+    try:
+        for result in stage.process(inputs()):
+            put(outbox, result, stopped)
+        put(outbox, upstream_failure or EndOfStream(), stopped)
+    except Stopped:
+        pass
+    except Exception as e:
+        try:
+            put(outbox, StageFailure(e), stopped)
+        except Stopped:
+            pass
+    finally:
+        # a worker process waits for the items it put on its outbox to be flushed before it ends, so that none is lost
+        # (or cut short, which would block whoever reads it); a stopped pipeline drains the outboxes meanwhile
+        if hasattr(inbox, "cancel_join_thread"):
+            inbox.cancel_join_thread()
+
+
+class StageParallelPipeline(Pipeline[TPipelineInput, TPipelineResult]):
+    """A pipeline which runs each of its stages concurrently, on its own worker thread or process.
+
+    Stages are connected by bounded queues, so that stage `k` can process item `i` while stage `k + 1` processes item `i - 1`.
+    The throughput of the pipeline is therefore that of its slowest stage, rather than the sum of all of its stages.
+    A stage blocks when the queue to the next stage is full, so a fast stage cannot get arbitrarily far ahead of a slow one.
+
+    With process workers, the stages and the items flowing between them must be picklable; an item which is not raises an error.
+    If a worker process dies (e.g. it is killed for running out of memory), the pipeline raises a `RuntimeError`.
+    Closing `stream` early stops the workers; worker processes still running after `SHUTDOWN_TIMEOUT` are terminated.
+    Note that `consume` is then called in the worker processes, so its side effects are not visible to the calling process.
+
+    Attributes:
+        queue_size (int):
+            The maximum number of items waiting between two stages.
+        workers (str):
+            Either "thread" (the default) or "process".
+        mp_context (multiprocessing.context.BaseContext | None):
+            The multiprocessing context used to start worker processes.
+    """
+    def __init__(
+        self,
+        stages: Iterable[PipelineStage[Any, Any]] = None,
+        queue_size: int = 64,
+        workers: str = "thread",
+        mp_context: BaseContext | None = None
+    ):
+        super().__init__(stages)
+        if workers not in ("thread", "process"):
+            raise ValueError(f"workers must be either 'thread' or 'process', not {workers!r}.")
+        self.queue_size = queue_size
+        self.workers = workers
+        self.mp_context = mp_context
+
+    def stream(self, input: TPipelineInput) -> Iterator[TPipelineResult]:
+        if self.workers == "thread":
+            make_queue, make_event, make_worker = queue.Queue, threading.Event, threading.Thread
+        else:
+            context = self.mp_context or multiprocessing.get_context()
+            make_event, make_worker = context.Event, context.Process
+
+            def make_queue(maxsize: int) -> PicklingQueue:
+                return PicklingQueue(context.Queue(maxsize=maxsize))
+
+        queues = [make_queue(maxsize=self.queue_size) for _ in range(len(self.stages) + 1)]
+        stopped = make_event()
+        workers = [
+            make_worker(target=run_stage_worker, args=(stage, inbox, outbox, stopped), daemon=True)
+            for stage, inbox, outbox in zip(self.stages, queues, queues[1:])
+        ]
+        for w in workers:
+            w.start()
+
+        try:
+            put(queues[0], input, stopped)
+            put(queues[0], EndOfStream(), stopped)
+
+            while not isinstance(result := get_result(queues[-1], workers), EndOfStream):
+                if isinstance(result, StageFailure):
+                    raise result.exception
+                yield result
+        finally:
+            stopped.set()
+            if self.workers == "process":
+                self.stop_processes(queues, workers)
+            for w in workers:
+                w.join()
+
+    def stop_processes(self, queues: list[PicklingQueue], workers: list[Any]) -> None:
+        """Wait for the worker processes of a stopped pipeline to end, terminating those still running after `SHUTDOWN_TIMEOUT`.
+
+        A worker which has put its last items may still be flushing them to a full queue, so the outbox of each worker
+        is drained while it runs. (Only while it runs: an item cut short by a worker which died cannot be read.)
+        """
+        deadline = time.monotonic() + SHUTDOWN_TIMEOUT
+        while any(w.is_alive() for w in workers) and time.monotonic() < deadline:
+            for w, outbox in zip(workers, queues[1:]):
+                if w.is_alive():
+                    outbox.discard()
+            for w in workers:
+                w.join(timeout=POLL_INTERVAL / len(workers))
+        for w in workers:
+            if w.is_alive():
+                w.terminate()
+        for q in queues:
+            q.cancel_join_thread()
+
+    def run(self, input: TPipelineInput) -> list[TPipelineResult]:
+        return list(self.stream(input))
@@ -0,0 +1,146 @@
+# Copyright (c) 2024 Contributors
+# Authors: Christian Smith; John Azariah
+# All rights reserved.
+
+import itertools
+import os
+import threading
+import time
+import weakref
+
+# The durability policies of a `FileWriter`
+DURABILITIES = ("none", "file", "group")
+
+# Whether files can be opened and renamed relative to an open folder (e.g. not on Windows)
+SUPPORTS_DIR_FD = os.open in os.supports_dir_fd and os.rename in os.supports_dir_fd
+
+
+def fsync_directory(folder: str) -> None:
+    """Make the renames in a folder durable. Folders cannot be opened (or synced) on some platforms, e.g. Windows."""
+    try:
+        fd = os.open(folder, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class FileWriter:
+    """Writes whole files atomically: each file is written to a temporary file in the same folder, which is then renamed
+    over the target, so that a crash never leaves a truncated file behind.
+
+    Attributes:
+        durability (str):
+            When written files are flushed to disk, trading throughput for durability:
+            "none" (the default) leaves it to the operating system;
+            "file" syncs each file (and its folder) before the write returns;
+            "group" syncs files in groups, making a group visible (renaming its files) only once all of its files are synced.
+        group_size (int):
+            The number of files in a group, when `durability` is "group".
+        group_interval (float):
+            The time in seconds after which a group is synced on the next write, even if it is not full.
+        folder (str | None):
+            The folder to which the paths given to `write` are relative. It is created (and, where supported, opened)
+            once, so that each write costs little more than opening, writing and renaming a file.
+
+    With "group" durability, the files of the last group only appear once `flush` (or `close`) is called.
+    `write` may be called from several threads at once.
+    """
+    def __init__(self, durability: str = "none", group_size: int = 64, group_interval: float = 0.1, folder: str | None = None):
+        if durability not in DURABILITIES:
+            raise ValueError(f"Unknown durability {durability!r}: expected one of {', '.join(DURABILITIES)}.")
+        self.durability = durability
+        self.group_size = group_size
+        self.group_interval = group_interval
+        self.folder = folder
+        self.__setstate__({})
+
+    def __getstate__(self):
+        # pending files, folder descriptors and locks are specific to the process writing them
+        return {"durability": self.durability, "group_size": self.group_size, "group_interval": self.group_interval, "folder": self.folder}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+        self.group = []
+        self.group_started = None
+        self.temporary_names = itertools.count()
+        self.dir_fd = None
+        self.dir_fd_finalizer = None
+        if self.folder is not None:
+            os.makedirs(self.folder, exist_ok=True)
+            if SUPPORTS_DIR_FD:
+                self.dir_fd = os.open(self.folder, os.O_RDONLY)
+                # writers which are never closed (e.g. held by a stage) release their folder once they are collected
+                self.dir_fd_finalizer = weakref.finalize(self, os.close, self.dir_fd)
+
+    def resolve(self, path: str) -> str:
+        """The path to use in file system calls: relative to the open folder if there is one, otherwise to the working folder."""
+        if self.folder is None or self.dir_fd is not None:
+            return path
+        return os.path.join(self.folder, path)
+
+    def write(self, path: str, content: bytes) -> None:
+        folder, name = os.path.split(path)
+        temporary_path = os.path.join(folder, f".{name}.{os.getpid()}.{next(self.temporary_names)}.tmp")
+        fd = os.open(self.resolve(temporary_path), os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, "O_BINARY", 0), 0o666, dir_fd=self.dir_fd)
+        try:
+            with memoryview(content) as view:
+                while view:
+                    view = view[os.write(fd, view):]
+            if self.durability == "file":
+                os.fsync(fd)
+        except BaseException:
+            os.close(fd)
+            os.remove(self.resolve(temporary_path), dir_fd=self.dir_fd)
+            raise
+
+        if self.durability != "group":
+            os.close(fd)
+            self.rename(temporary_path, path)
+            if self.durability == "file":
+                self.sync_folders([path])
+            return
+
+        # the file is kept open until its group is synced
+        with self.lock:
+            self.group.append((fd, temporary_path, path))
+            if self.group_started is None:
+                self.group_started = time.monotonic()
+            if len(self.group) < self.group_size and time.monotonic() - self.group_started < self.group_interval:
+                return
+            group, self.group, self.group_started = self.group, [], None
+        self.commit(group)
+
+    def rename(self, temporary_path: str, path: str) -> None:
+        os.replace(self.resolve(temporary_path), self.resolve(path), src_dir_fd=self.dir_fd, dst_dir_fd=self.dir_fd)
+
+    def sync_folders(self, paths: list[str]) -> None:
+        for folder in {os.path.dirname(path) for path in paths}:
+            if folder == "" and self.dir_fd is not None:
+                os.fsync(self.dir_fd)
+            else:
+                fsync_directory(self.resolve(folder) or ".")
+
+    def commit(self, group: list[tuple[int, str, str]]) -> None:
+        for fd, _, _ in group:
+            os.fsync(fd)
+            os.close(fd)
+        for _, temporary_path, path in group:
+            self.rename(temporary_path, path)
+        self.sync_folders([path for _, _, path in group])
+
+    def flush(self) -> None:
+        """Sync and rename the files of the current group."""
+        with self.lock:
+            group, self.group, self.group_started = self.group, [], None
+        if group:
+            self.commit(group)
+
+    def close(self) -> None:
+        self.flush()
+        if self.dir_fd is not None:
+            self.dir_fd_finalizer()
+            self.dir_fd = None
@@ -2,53 +2,597 @@
 # Authors: Christian Smith; John Azariah
 # All rights reserved.
 
+import hashlib
+import mmap
 import os
+import shutil
+import tempfile
 import msgspec
 from typing import Any
-from collections.abc import Iterable
+from collections import deque
+from collections.abc import Callable, Iterable, Iterator
+from functools import partial
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
 from dataclasses import dataclass
 
-from .pipeline import EnhancedPipeline, PipelineStageEnhancer, Pipeline, PipelineStage
+from .pipeline import EnhancedPipeline, PipelineStageEnhancer, Pipeline, PipelineStage, map_on_executor
+from .caching import CacheStats, stage_fingerprint
+from .file_writer import DURABILITIES, FileWriter, fsync_directory
+from .serialization import Codec, JsonCodec, get_codec
+
+
+# The ways in which records may be stored in a stage folder
+LAYOUTS = ("files", "segments")
+
+# The name of the file recording the codec of the records in a stage folder
+CODEC_FILENAME = ".codec"
+
+# The name of the file recording the inputs processed by a stage, in its output folder
+MANIFEST_FILENAME = ".manifest"
+
+# The name of the file listing the outputs held by an entry of an `OutputCache`
+OUTPUTS_FILENAME = ".outputs"
+
+# Marks the end of the inputs read from a file
+END = object()
 
 
 @dataclass
 class FileSystemContext:
+    """The file system context shared by the stages of a `FileSystemCoupledPipeline`.
+
+    Attributes:
+        document_root (str):
+            The root directory, under which each stage reads from and writes to its own folder.
+        read_ahead (int):
+            The number of input files read from disk ahead of the stage processing them, on a background thread.
+            When 0 (the default), each file is read just before it is processed.
+        layout (str):
+            How records are stored in each stage folder.
+            "files" (the default) stores each record in its own file.
+            "segments" appends the records to segment files, rolling over to a new segment every `segment_size` bytes.
+        segment_size (int):
+            The size in bytes beyond which a segment is closed and a new one started, when `layout` is "segments".
+        codec (str):
+            The name of the codec with which stages write their results, e.g. "json" (the default), "msgpack" or "msgpack+zlib".
+            Stages read their inputs with the codec recorded in their input folder, so a change of codec only affects new results.
+        mmap_threshold (int | None):
+            The size in bytes from which input files are memory-mapped rather than read, so that large files are decoded
+            without first being copied into memory. Defaults to 16 MiB; `None` always reads files.
+        io_workers (int):
+            The number of threads which read and decode input files, and encode and write results, concurrently with
+            the stage's `transform`. When 0 (the default), all of these happen on the thread running the stage.
+        max_in_flight (int):
+            The maximum number of input files, and of results, being processed by the `io_workers` at any time.
+        durability (str):
+            When output files are synced to disk: "none" (the default), "file" (each file) or "group" (every `group_size`
+            files, or `group_interval` seconds). Output files are always written atomically, whatever the durability.
+        group_size (int):
+            The number of output files synced together, when `durability` is "group".
+        group_interval (float):
+            The time in seconds after which a group of output files is synced, even if it is not full.
+        fan_out (int):
+            The number of levels of subfolders, named after a hash of each file name, under which output files are written
+            in the "files" layout, e.g. 2 writes `ab/cd/name.json`. Each level has up to 256 subfolders, which keeps the number
+            of entries in each folder bounded. When 0 (the default), files are written directly in the stage folder.
+            Input files are found in subfolders whatever the `fan_out`.
+        resume (bool):
+            If set, each stage skips the input files it has already processed, as recorded in the manifest in its output folder,
+            so that an interrupted (or repeated) run only processes new or changed files. Only supported by the "files" layout.
+        cache_directory (str | None):
+            A folder caching the output files of each stage, keyed by a hash of the stage and of the content of each input file.
+            Before a stage processes an input file, its cached outputs are hard-linked (or copied, where links are not supported)
+            into its output folder, and the file is skipped. Pipelines with different `document_root`s may share the folder,
+            so that work is shared between runs over mostly unchanged data. Only supported by the "files" layout.
+    """
     document_root: str
+    read_ahead: int = 0
+    layout: str = "files"
+    segment_size: int = 64 * 1024 * 1024
+    codec: str = "json"
+    mmap_threshold: int | None = 16 * 1024 * 1024
+    io_workers: int = 0
+    max_in_flight: int = 64
+    durability: str = "none"
+    group_size: int = 64
+    group_interval: float = 0.1
+    fan_out: int = 0
+    resume: bool = False
+    cache_directory: str | None = None
+
+    def __post_init__(self):
+        if self.layout not in LAYOUTS:
+            raise ValueError(f"Unknown layout {self.layout!r}: expected one of {', '.join(LAYOUTS)}.")
+        get_codec(self.codec)
+        if self.durability not in DURABILITIES:
+            raise ValueError(f"Unknown durability {self.durability!r}: expected one of {', '.join(DURABILITIES)}.")
+        if self.resume and self.layout != "files":
+            raise ValueError("Resuming a run is only supported by the \"files\" layout.")
+        if self.cache_directory is not None and self.layout != "files":
+            raise ValueError("Caching outputs is only supported by the \"files\" layout.")
+
+
+def read_file(path: str, mmap_threshold: int | None = None) -> bytes | mmap.mmap:
+    """Read a file, or memory-map it if it holds at least `mmap_threshold` bytes.
+
+    A memory map is released once the last reference to it (or to a view of it) is dropped.
+    """
+    with open(path, "rb") as f:
+        if mmap_threshold is not None and os.fstat(f.fileno()).st_size >= max(mmap_threshold, 1):
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return f.read()
+
+
+def partitioned(name: str, levels: int) -> str:
+    """The path of a file under `levels` of subfolders, each named after a byte of the hash of its name."""
+    if levels <= 0:
+        return name
+    digest = hashlib.blake2b(name.encode(), digest_size=levels).hexdigest()
+    return os.path.join(*(digest[2 * level:2 * level + 2] for level in range(levels)), name)
+
+
+def has_content(path: str, content: bytes) -> bool:
+    """Check whether a file exists and holds exactly the given content."""
+    try:
+        return os.path.getsize(path) == len(content) and read_file(path) == content
+    except FileNotFoundError:
+        return False
+
+
+def link_file(source: str, target: str) -> None:
+    """Hard-link `source` at `target`, replacing any file there. The file is copied where links are not supported, e.g. across file systems."""
+    temporary_path = os.path.join(os.path.dirname(target), f".{os.path.basename(target)}.{os.getpid()}.link")
+    try:
+        os.link(source, temporary_path)
+    except OSError:
+        shutil.copyfile(source, temporary_path)
+    os.replace(temporary_path, target)
+
+
+def read_records(codec: Codec, path: str, mmap_threshold: int | None = None) -> list[bytes | memoryview]:
+    """Read the encoded records stored in a file: a single record, or all the records of a segment."""
+    content = read_file(path, mmap_threshold)
+    return codec.split(content) if path.endswith(codec.segment_extension) else [content]
+
+
+def read_codec(folder: str) -> Codec:
+    """Get the codec recorded in a stage folder, defaulting to JSON for folders populated by hand."""
+    try:
+        with open(os.path.join(folder, CODEC_FILENAME)) as f:
+            return get_codec(f.read().strip())
+    except FileNotFoundError:
+        return JsonCodec()
+
+
+def write_codec(folder: str, codec: Codec) -> None:
+    os.makedirs(folder, exist_ok=True)
+    FileWriter().write(os.path.join(folder, CODEC_FILENAME), codec.name.encode())
+
+
+class SegmentWriter:
+    """Appends records, framed by `codec`, to a sequence of segment files in a folder.
+
+    A new segment is started when writing a record would grow the current one beyond `segment_size` bytes.
+    Segments left in the folder by earlier runs are removed when the writer is created.
+
+    Each segment is written under a temporary name, and renamed once it is complete, so that a crash never leaves a
+    truncated segment behind. Unless `durability` is "none", segments are synced to disk before they are renamed.
+    """
+    def __init__(self, folder: str, segment_size: int, codec: Codec, durability: str = "none"):
+        self.folder = folder
+        self.segment_size = segment_size
+        self.codec = codec
+        self.durability = durability
+        self.segment_index = 0
+        self.segment = None
+        self.segment_path = None
+        self.segment_bytes = 0
+
+        os.makedirs(self.folder, exist_ok=True)
+        with os.scandir(self.folder) as entries:
+            for entry in entries:
+                if entry.name.startswith(("segment_", ".segment_")) and entry.is_file():
+                    os.remove(entry.path)
+
+    def close_segment(self) -> None:
+        if self.durability != "none":
+            self.segment.flush()
+            os.fsync(self.segment.fileno())
+        self.segment.close()
+        os.replace(self.segment.name, self.segment_path)
+        if self.durability != "none":
+            fsync_directory(self.folder)
+        self.segment = None
+
+    def next_segment(self) -> None:
+        if self.segment is not None:
+            self.close_segment()
+
+        self.segment_index += 1
+        name = f"segment_{self.segment_index:06d}{self.codec.segment_extension}"
+        self.segment_path = os.path.join(self.folder, name)
+        self.segment = open(os.path.join(self.folder, f".{name}.tmp"), "wb")
+        self.segment_bytes = 0
+
+    def write(self, record: bytes) -> None:
+        framed = self.codec.frame(record)
+        if self.segment is None or (self.segment_bytes > 0 and self.segment_bytes + len(framed) > self.segment_size):
+            self.next_segment()
+        self.segment.write(framed)
+        self.segment_bytes += len(framed)
+
+    def close(self) -> None:
+        if self.segment is not None:
+            self.close_segment()
+
+
+@dataclass
+class ManifestEntry:
+    """Records that an input file was processed, and the names of the files holding its results."""
+    input: str
+    size: int
+    mtime_ns: int
+    outputs: list[str]
+
+
+class Manifest:
+    """The inputs processed by a stage, kept in an append-only file in its output folder.
+
+    An input is recorded (and the record flushed) as soon as its results have been written, so a run which is interrupted
+    can be resumed from where it stopped. An input is processed again if its size or modification time has changed, or if
+    any of its outputs is missing.
+    """
+    def __init__(self, folder: str):
+        self.folder = folder
+        self.path = os.path.join(folder, MANIFEST_FILENAME)
+        self.encoder = msgspec.json.Encoder()
+        self.entries = self.load()
+        self.stats = {}
+
+        # compact the manifest, dropping superseded entries (and any entry cut short by a crash)
+        with open(self.path + ".tmp", "wb") as f:
+            f.writelines(self.encoder.encode(entry) + b"\n" for entry in self.entries.values())
+        os.replace(self.path + ".tmp", self.path)
+        self.file = open(self.path, "ab")
+
+    def load(self) -> dict[str, ManifestEntry]:
+        entries = {}
+        try:
+            content = read_file(self.path)
+        except FileNotFoundError:
+            return entries
+
+        decoder = msgspec.json.Decoder(ManifestEntry)
+        for line in content.splitlines():
+            try:
+                entry = decoder.decode(line)
+            except msgspec.DecodeError:
+                continue
+            entries[entry.input] = entry
+        return entries
+
+    def is_processed(self, path: str, stat: os.stat_result) -> bool:
+        entry = self.entries.get(os.path.basename(path))
+        if entry is None or (entry.size, entry.mtime_ns) != (stat.st_size, stat.st_mtime_ns):
+            return False
+        return all(os.path.exists(os.path.join(self.folder, output)) for output in entry.outputs)
+
+    def unprocessed(self, paths: Iterable[str]) -> Iterator[str]:
+        """Lazily yield the paths which have not been processed, noting their size and modification time before they are read."""
+        for path in paths:
+            stat = os.stat(path)
+            if not self.is_processed(path, stat):
+                self.stats[path] = stat
+                yield path
+
+    def record(self, path: str, outputs: list[str]) -> None:
+        stat = self.stats.pop(path)
+        entry = ManifestEntry(input=os.path.basename(path), size=stat.st_size, mtime_ns=stat.st_mtime_ns, outputs=outputs)
+        self.entries[entry.input] = entry
+        self.file.write(self.encoder.encode(entry) + b"\n")
+        self.file.flush()
+
+    def close(self) -> None:
+        self.file.close()
+
+
+class OutputCache:
+    """The output files of a stage, kept in `folder` and keyed by a hash of the stage and of the content of an input file.
+
+    The stage is given by its `stage_fingerprint`, taken once before it runs, so that its configuration (rather than
+    the state it updates as it runs) is what keys its outputs.
+
+    Each entry is a subfolder holding hard links to the output files of one input file, and a list of their names.
+    Entries are complete once they appear: they are built under a temporary name, and then renamed.
+    Output files are only ever replaced (by renaming a new file over them), never modified in place, so the links
+    in an entry keep their content whatever happens to the stage folders they were linked from.
+    """
+    def __init__(self, folder: str, fingerprint: bytes):
+        self.folder = folder
+        self.fingerprint = fingerprint
+        self.stats = CacheStats()
+        os.makedirs(folder, exist_ok=True)
+
+    def key(self, input_codec: Codec, output_codec: Codec, path: str) -> str:
+        prefix = self.fingerprint + f"\0{input_codec.name}\0{output_codec.name}\0".encode()
+        with open(path, "rb") as f:
+            return hashlib.file_digest(f, lambda: hashlib.blake2b(prefix)).hexdigest()
+
+    def entry(self, key: str) -> str:
+        return os.path.join(self.folder, key[:2], key)
+
+    def lookup(self, key: str) -> list[str] | None:
+        """The names of the output files cached for a key, or `None` on a miss."""
+        try:
+            with open(os.path.join(self.entry(key), OUTPUTS_FILENAME), "rb") as f:
+                outputs = msgspec.json.decode(f.read(), type=list[str])
+        except FileNotFoundError:
+            self.stats.misses += 1
+            return None
+        self.stats.hits += 1
+        return outputs
+
+    def store(self, key: str, folder: str, outputs: list[str]) -> None:
+        """Cache the output files of an input file, given by their paths relative to `folder`."""
+        entry = self.entry(key)
+        temporary_entry = None
+        try:
+            os.makedirs(os.path.dirname(entry), exist_ok=True)
+            # a unique name, so that neither concurrent runs nor the leftovers of an interrupted run get in the way
+            temporary_entry = tempfile.mkdtemp(prefix=f".{key}.", suffix=".tmp", dir=os.path.dirname(entry))
+            for output in outputs:
+                link_file(os.path.join(folder, output), os.path.join(temporary_entry, os.path.basename(output)))
+            with open(os.path.join(temporary_entry, OUTPUTS_FILENAME), "wb") as f:
+                f.write(msgspec.json.encode([os.path.basename(output) for output in outputs]))
+            os.rename(temporary_entry, entry)
+        except OSError:
+            # e.g. the entry was stored by another run in the meantime
+            if temporary_entry is not None:
+                shutil.rmtree(temporary_entry, ignore_errors=True)
 
 
 @dataclass
 class FileSystemEnhancer(PipelineStageEnhancer[FileSystemContext]):
-    def __init__(self, stage: PipelineStage[Any, Any], stage_index: int, stage_count: int):
-        super().__init__(stage=stage, stage_index=stage_index, stage_count=stage_count)
+    def __init__(self, stage: PipelineStage[Any, Any], stage_index: int, stage_count: int, executor: Executor | None = None, ordered: bool = True):
+        super().__init__(stage=stage, stage_index=stage_index, stage_count=stage_count, executor=executor, ordered=ordered)
         self.input_subfolder = f"stage_{stage_index}"
         self.output_subfolder = f"stage_{stage_index + 1}"
-        self.json_encoder = msgspec.json.Encoder()
+        self.input_codec = JsonCodec()
+        self.output_codec = JsonCodec()
+        self.segment_writer = None
+        self.file_writer = FileWriter()
+        self.output_subfolders = set()
+        self.io_executor = None
+        self.pending_outputs = deque()
+        self.manifest = None
+        self.input_sources = deque()
+        self.current_source = None
+        self.current_outputs = []
+        self.output_cache = None
+        self.cache_keys = {}
+
+    def input_paths(self, context: FileSystemContext) -> Iterator[str]:
+        """Lazily yield the paths of the input files of the stage, followed by its input segments in the order they were written.
+
+        Only files written with `self.input_codec` are read. Both layouts are read regardless of `context.layout`,
+        so the first stage may be seeded with either.
+        """
+        segments = []
+        folders = [os.path.join(context.document_root, self.input_subfolder)]
+        while folders:
+            with os.scandir(folders.pop()) as entries:
+                for entry in entries:
+                    if entry.name.endswith(self.input_codec.extension) and entry.is_file():
+                        yield entry.path
+                    elif entry.name.endswith(self.input_codec.segment_extension) and entry.is_file():
+                        segments.append(entry.path)
+                    elif entry.is_dir():
+                        folders.append(entry.path)  # the subfolders written with `fan_out`
+        yield from sorted(segments)
+
+    def decode_inputs(self, contents: Iterable[bytes]) -> Iterator[Any]:
+        decode = self.input_codec.decoder(self.stage.TStageInput)
+        for content in contents:
+            yield decode(content)  # decoding calls `__post_init__`, which injects the `to_filename` attribute
 
     def generate_inputs(self, context: FileSystemContext) -> Iterable[Any]:
-        input_folder = os.path.join(context.document_root, self.input_subfolder)
-        for filename in os.listdir(input_folder):
-            if filename.endswith(".json"):
-                with open(os.path.join(input_folder, filename), "rb") as f:
-                    yield msgspec.json.decode(f.read(), type=self.stage.TStageInput, strict=False)  # TODO: JOHN - active bug here - this doesn't decorate the object with the filename attribute
+        """Lazily read and decode the input files (or segments) of the stage.
+
+        Files are read (and decoded) on the `io_workers` if there are any, otherwise up to `context.read_ahead` files are read ahead.
+        """
+        self.input_codec = read_codec(os.path.join(context.document_root, self.input_subfolder))
+        read = partial(read_records, self.input_codec, mmap_threshold=context.mmap_threshold)
+        paths = self.input_paths(context)
+        if self.manifest is not None:
+            paths = self.manifest.unprocessed(paths)
+        if self.output_cache is not None:
+            paths = self.uncached(context, paths)
+
+        def read_path(path: str) -> tuple[str, list[bytes | memoryview]]:
+            return path, read(path)
+
+        if self.io_executor is not None:
+            def read_and_decode(path: str) -> tuple[str, list[Any]]:
+                return path, list(self.decode_inputs(read(path)))
+
+            yield from self.track_inputs(map_on_executor(read_and_decode, paths, self.io_executor, max_pending=context.max_in_flight))
+        elif context.read_ahead > 0:
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                loaded = map_on_executor(read_path, paths, executor, max_pending=context.read_ahead)
+                yield from self.track_inputs((path, self.decode_inputs(contents)) for path, contents in loaded)
+        else:
+            yield from self.track_inputs((path, self.decode_inputs(contents)) for path, contents in map(read_path, paths))
+
+    def uncached(self, context: FileSystemContext, paths: Iterable[str]) -> Iterator[str]:
+        """Lazily yield the paths whose outputs are not cached, linking the cached outputs of the others into the output folder."""
+        for path in paths:
+            key = self.output_cache.key(self.input_codec, self.output_codec, path)
+            if (outputs := self.output_cache.lookup(key)) is None:
+                self.cache_keys[path] = key
+                yield path
+                continue
+
+            filenames = [self.output_filename(context, output) for output in outputs]
+            for output, filename in zip(outputs, filenames):
+                source = os.path.join(self.output_cache.entry(key), output)
+                target = os.path.join(self.file_writer.folder, filename)
+                if os.path.exists(target) and os.path.samefile(source, target):
+                    continue  # leave the file untouched, so that the next stage does not process it again
+                link_file(source, target)
+            if self.manifest is not None:
+                self.after_outputs(context, partial(self.manifest.record, path, filenames))
+
+    def track_inputs(self, loaded: Iterable[tuple[str, Iterable[Any]]]) -> Iterator[Any]:
+        """Yield the inputs read from each path, noting (when resuming or caching) the path each one came from, and whether it is the last one."""
+        if self.manifest is None and self.output_cache is None:
+            for _, inputs in loaded:
+                yield from inputs
+            return
+
+        for path, inputs in loaded:
+            inputs = iter(inputs)
+            if (input := next(inputs, END)) is END:
+                continue
+            for next_input in inputs:
+                self.input_sources.append((path, False))
+                yield input
+                input = next_input
+            self.input_sources.append((path, True))
+            yield input
+
+    def defer_output(self, context: FileSystemContext, future: Future, then: Callable[[Any], None] | None = None) -> None:
+        """Track an output being processed by the `io_workers`, waiting for the oldest ones while more than `max_in_flight` are pending."""
+        self.pending_outputs.append((future, then))
+        while len(self.pending_outputs) > context.max_in_flight:
+            self.complete_output()
+
+    def complete_output(self) -> None:
+        """Wait for the oldest pending output, raising any error, and pass its result on to its continuation."""
+        future, then = self.pending_outputs.popleft()
+        result = future.result()
+        if then is not None:
+            then(result)
+
+    def after_outputs(self, context: FileSystemContext, callback: Callable[[], None]) -> None:
+        """Call `callback` once all the outputs processed so far have been written."""
+        if self.io_executor is not None:
+            written = Future()
+            written.set_result(None)
+            self.defer_output(context, written, then=lambda _: callback())
+        else:
+            callback()
+
+    def complete_source(self, path: str, outputs: list[str]) -> None:
+        """Record an input file in the manifest, and cache its outputs, once all of them have been written."""
+        if self.manifest is not None:
+            self.manifest.record(path, outputs)
+        if self.output_cache is not None:
+            if self.file_writer.durability == "group":
+                self.file_writer.flush()  # the files of a group only appear once it is synced
+            self.output_cache.store(self.cache_keys.pop(path), self.file_writer.folder, outputs)
+
+    def process_outputs(self, context: FileSystemContext, results: list[Any]) -> FileSystemContext:
+        if not self.input_sources:
+            return super().process_outputs(context, results)
+
+        # the results of each input arrive in the order of the inputs, so they can be matched with the paths they came from
+        self.current_source, last = self.input_sources.popleft()
+        context = super().process_outputs(context, results)
+        if last:
+            self.after_outputs(context, partial(self.complete_source, self.current_source, self.current_outputs))
+            self.current_source = None
+            self.current_outputs = []
+        return context
+
+    def output_filename(self, context: FileSystemContext, name: str) -> str:
+        """The path of an output file relative to the output folder, creating the subfolder it is written to if need be."""
+        filename = partitioned(name, context.fan_out)
+        if (subfolder := os.path.dirname(filename)) and subfolder not in self.output_subfolders:
+            os.makedirs(os.path.join(self.file_writer.folder, subfolder), exist_ok=True)
+            self.output_subfolders.add(subfolder)
+        return filename
 
     def process_output(self, context: FileSystemContext, result: Any, result_index: int, result_count: int) -> None:
-        def write_json_to_file(result: Any, filename: str) -> None:
-            os.makedirs(os.path.join(context.document_root, self.output_subfolder), exist_ok=True)
-            output_file_name = os.path.join(context.document_root, self.output_subfolder, filename)
-            with open(output_file_name, "wb") as f:
-                f.write(self.json_encoder.encode(result))
+        if self.segment_writer is not None:
+            if self.io_executor is not None:
+                # results are encoded concurrently, but appended to the segment in order
+                self.defer_output(context, self.io_executor.submit(self.output_codec.encode, result), then=self.segment_writer.write)
+            else:
+                self.segment_writer.write(self.output_codec.encode(result))
+            return
+
+        def write_file(result: Any, filename: str) -> None:
+            content = self.output_codec.encode(result)
+            if context.resume and has_content(os.path.join(self.file_writer.folder, filename), content):
+                return  # leave the file untouched, so that the next stage does not process it again
+            self.file_writer.write(filename, content)
+
+        def write_to_file(result: Any, filename: str) -> None:
+            filename = self.output_filename(context, filename + self.output_codec.extension)
+            if self.current_source is not None:
+                self.current_outputs.append(filename)
+            if self.io_executor is not None:
+                self.defer_output(context, self.io_executor.submit(write_file, result, filename))
+            else:
+                write_file(result, filename)
 
         if getattr(result, "filename", None) is not None:
             match (result_index, result_count):
                 case (1, 1):
-                    write_json_to_file(result, f"{result.filename}.json")  # note - this uses the attribute injected by the `to_filename` decorator
+                    write_to_file(result, f"{result.filename}")  # note - this uses the attribute injected by the `to_filename` decorator
                 case (_, _):
-                    write_json_to_file(result, f"{result.filename}_{result_index}.json")  # note - this uses the attribute injected by the `to_filename` decorator
+                    write_to_file(result, f"{result.filename}_{result_index}")  # note - this uses the attribute injected by the `to_filename` decorator
         else:
             print(f"Warning: No filename attribute found on result object {result}. Writing result to generic filename.")
-            write_json_to_file(result, f"result_{result_index}.json")
+            write_to_file(result, f"result_{result_index}")
+
+    def run(self, context: FileSystemContext) -> FileSystemContext:
+        if (context.resume or context.cache_directory is not None) and self.executor is not None and not self.ordered:
+            raise ValueError("Resuming a run, or caching outputs, requires the results of each stage to be processed in order.")
+
+        output_folder = os.path.join(context.document_root, self.output_subfolder)
+        self.output_codec = get_codec(context.codec)
+        write_codec(output_folder, self.output_codec)
+        if context.resume:
+            self.manifest = Manifest(output_folder)
+        # the output folder is prepared once, so that writing a result only costs opening, writing and renaming its file
+        self.file_writer = FileWriter(context.durability, context.group_size, context.group_interval, folder=output_folder)
+        self.output_subfolders = set()
+        if context.cache_directory is not None:
+            self.output_cache = OutputCache(context.cache_directory, stage_fingerprint(self.stage))
+        if context.layout == "segments":
+            self.segment_writer = SegmentWriter(output_folder, context.segment_size, self.output_codec, context.durability)
+        if context.io_workers > 0:
+            self.io_executor = ThreadPoolExecutor(max_workers=context.io_workers)
+        try:
+            context = super().run(context)
+            while self.pending_outputs:
+                self.complete_output()
+            return context
+        finally:
+            # the io workers are stopped first, so that none of them is still writing once the writer is closed
+            if self.io_executor is not None:
+                self.io_executor.shutdown(cancel_futures=True)
+                self.io_executor = None
+                self.pending_outputs.clear()
+            self.file_writer.close()
+            if self.manifest is not None:
+                self.manifest.close()
+                self.manifest = None
+            self.output_cache = None
+            self.cache_keys.clear()
+            self.input_sources.clear()
+            self.current_source = None
+            self.current_outputs = []
+            if self.segment_writer is not None:
+                self.segment_writer.close()
+                self.segment_writer = None
 
 
 class FileSystemCoupledPipeline(EnhancedPipeline[FileSystemEnhancer, FileSystemContext]):
-    def __init__(self, document_root: str, pipeline: Pipeline[Any, Any]):
-        super().__init__(context=FileSystemContext(document_root=document_root), pipeline=pipeline)
+    """Runs a pipeline with each stage reading its inputs from, and writing its results to, folders under `document_root`.
+
+    Any additional keyword arguments (e.g. `read_ahead`, `layout`, `codec`, `io_workers` or `resume`) are options of the `FileSystemContext`.
+    """
+    def __init__(self, document_root: str, pipeline: Pipeline[Any, Any], executor: Executor | None = None, ordered: bool = True, **options: Any):
+        super().__init__(context=FileSystemContext(document_root=document_root, **options), pipeline=pipeline, executor=executor, ordered=ordered)
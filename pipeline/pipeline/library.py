@@ -2,11 +2,16 @@
 
 from collections.abc import Callable
 from dataclasses import dataclass
+import dataclasses
 import json
+import queue
+import sys
+import threading
+import time
 import pathlib
-import os
 import msgspec
 
+from .file_writer import FileWriter
 from .pipeline import TStageInput, TStageResult, PipelineStage
 
 
@@ -22,17 +27,50 @@ class FormatPrintToConsole(PipelineStage[TStageInput, TStageResult]):
             An optional function that formats the input prefix.
         postfix_formatter (Callable[[TPipelineInput], str] | None):
             An optional function that formats the input postfix.
+        batch_size (int):
+            The number of lines written to the console at once, with a single `sys.stdout.write`. Defaults to 1.
+        flush_interval (float | None):
+            The time in seconds after which buffered lines are written on the next input, even if the batch is not full.
+        sample_every (int):
+            Only every `sample_every`-th input (starting with the first) is printed. Defaults to 1, which prints every input.
 
     Methods:
         to_string(input: TPipelineInput) -> str:
             Formats the input to a string.
         consume(input: TPipelineInput) -> None:
             Prints the string representation of the input to the console.
+        flush() -> None:
+            Writes the buffered lines to the console. Call it (or `close`, or use the stage as a context manager)
+            once the pipeline has run, when `batch_size` is more than 1.
+        throughput() -> float:
+            The number of inputs consumed per second, since the first one.
     """
 
     content_formatter: Callable[[TStageInput], str] | None = None
     prefix_formatter: Callable[[TStageInput], str] | None = None
     postfix_formatter: Callable[[TStageInput], str] | None = None
+    batch_size: int = 1
+    flush_interval: float | None = None
+    sample_every: int = 1
+
+    def __post_init__(self):
+        if self.batch_size < 1:
+            raise ValueError(f"batch_size must be at least 1, not {self.batch_size!r}.")
+        if self.sample_every < 1:
+            raise ValueError(f"sample_every must be at least 1, not {self.sample_every!r}.")
+        self.__setstate__({})
+
+    def __getstate__(self):
+        # the buffered lines and the counters are specific to the process printing them
+        return {name: value for name, value in self.__dict__.items() if name not in ("lock", "lines", "count", "started", "flushed")}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+        self.lines = []
+        self.count = 0
+        self.started = None
+        self.flushed = None
 
     def to_string(self, input: TStageInput) -> str:
         return f"""\
@@ -41,7 +79,41 @@ class FormatPrintToConsole(PipelineStage[TStageInput, TStageResult]):
 {self.postfix_formatter(input) if self.postfix_formatter else ""}"""
 
     def consume(self, input: TStageInput) -> None:
-        print(self.to_string(input))
+        with self.lock:
+            now = time.monotonic()
+            if self.started is None:
+                self.started = self.flushed = now
+            self.count += 1
+            if (self.count - 1) % self.sample_every == 0:
+                self.lines.append(self.to_string(input))
+
+            interval_elapsed = self.flush_interval is not None and now - self.flushed >= self.flush_interval
+            if len(self.lines) >= self.batch_size or (self.lines and interval_elapsed):
+                self.write_lines(now)
+
+    def write_lines(self, now: float) -> None:
+        lines, self.lines, self.flushed = self.lines, [], now
+        sys.stdout.write("".join(f"{line}\n" for line in lines))
+
+    def flush(self) -> None:
+        with self.lock:
+            if self.lines:
+                self.write_lines(time.monotonic())
+        sys.stdout.flush()
+
+    def close(self) -> None:
+        self.flush()
+
+    def __enter__(self) -> "FormatPrintToConsole":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def throughput(self) -> float:
+        with self.lock:
+            elapsed = time.monotonic() - self.started if self.started is not None else 0
+            return self.count / elapsed if elapsed > 0 else 0.0
 
 
 @dataclass
@@ -52,9 +124,30 @@ class WriteJsonToFile(PipelineStage[TStageInput, TStageResult]):
     Ensure that the input object is serializable to JSON.
     Ensure that the input object is decorated with the `to_filename` decorator.
 
+    Files are written atomically (see `FileWriter`), so that a crash never leaves a truncated file behind.
+
     Attributes:
         target_directory (str):
             [Mandatory] The directory where the JSON files will be written.
+        mode (str):
+            How the JSON is formatted.
+            "pretty" (the default) writes indented JSON with sorted keys, via the standard `json` module.
+            "fast" writes compact JSON, with fields in their declared order, encoded by `msgspec` into a reused buffer.
+            Both modes support msgspec Structs and dataclasses.
+        durability (str):
+            When files are synced to disk: "none" (the default), "file" (each file) or "group" (every `group_size` files,
+            or `group_interval` seconds). With "group", call `flush` once the pipeline has run, to write the last group.
+        group_size (int):
+            The number of files synced together, when `durability` is "group".
+        group_interval (float):
+            The time in seconds after which a group of files is synced, even if it is not full.
+        writer_threads (int):
+            The number of background threads writing files. When 0 (the default), `consume` writes each file itself.
+            Otherwise, `consume` only encodes its input and queues it to be written, and `close` must be called
+            (or the stage used as a context manager) once the pipeline has run, to wait for the queued files.
+            An error raised while writing a file is raised by the next call to `consume`, `flush` or `close`.
+        queue_size (int):
+            The maximum number of files waiting to be written by the `writer_threads`, beyond which `consume` blocks.
 
     Methods:
         get_filename(input: TPipelineInput) -> str:
@@ -63,11 +156,39 @@ class WriteJsonToFile(PipelineStage[TStageInput, TStageResult]):
             By default, if the input object has a `filename` attribute, it will be used.
         consume(input: TPipelineInput) -> None:
             Writes the input to a JSON file with the filename provided by the filename_extractor function.
+        flush() -> None:
+            Waits for the queued files to be written, and syncs and writes the files of the current group.
+        close() -> None:
+            Flushes the stage, stops its writer threads, and closes its `FileWriter` (which releases the target directory).
     """
     target_directory: str
+    mode: str = "pretty"
+    durability: str = "none"
+    group_size: int = 64
+    group_interval: float = 0.1
+    writer_threads: int = 0
+    queue_size: int = 64
 
     def __post_init__(self):
+        if self.mode not in ("pretty", "fast"):
+            raise ValueError(f"Unknown mode {self.mode!r}: expected \"pretty\" or \"fast\".")
         pathlib.Path(self.target_directory).mkdir(parents=True, exist_ok=True)
+        self.file_writer = FileWriter(self.durability, self.group_size, self.group_interval, folder=self.target_directory)
+        self.__setstate__({})
+
+    def __getstate__(self):
+        # encoders, buffers and writer threads cannot be pickled (e.g. for a `ProcessPoolPipeline`), so they are recreated
+        transient = ("encoder", "buffers", "writers", "writers_lock", "queue", "error")
+        return {name: value for name, value in self.__dict__.items() if name not in transient}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.encoder = msgspec.json.Encoder(enc_hook=str)
+        self.buffers = threading.local()
+        self.writers = []
+        self.writers_lock = threading.Lock()
+        self.queue = queue.Queue(maxsize=self.queue_size)
+        self.error = None
 
     def get_filename(self, input: TStageInput) -> str:
         if getattr(input, "filename", None) is not None:
@@ -76,9 +197,68 @@ class WriteJsonToFile(PipelineStage[TStageInput, TStageResult]):
             pass
 
     def to_json(self, input: TStageInput) -> str:
-        return json.dumps(msgspec.structs.asdict(input), default=str, sort_keys=True, indent=4).encode('utf-8')
+        if self.mode == "fast":
+            return self.encoder.encode(input)
+        fields = dataclasses.asdict(input) if dataclasses.is_dataclass(input) else msgspec.structs.asdict(input)
+        return json.dumps(fields, default=str, sort_keys=True, indent=4).encode('utf-8')
 
     def consume(self, input: TStageInput) -> None:
-        full_file_name = os.path.join(self.target_directory, f"{self.get_filename(input)}.json")
-        with open(full_file_name, "wb") as file:
-            file.write(self.to_json(input))
+        filename = f"{self.get_filename(input)}.json"
+        if self.writer_threads > 0:
+            self.raise_error()
+            self.start_writers()
+            self.queue.put((filename, self.to_json(input)))
+        elif self.mode == "fast":
+            # each thread encodes into its own buffer, which is reused for every input it writes
+            if (buffer := getattr(self.buffers, "buffer", None)) is None:
+                buffer = self.buffers.buffer = bytearray()
+            self.encoder.encode_into(input, buffer)
+            self.file_writer.write(filename, buffer)
+        else:
+            self.file_writer.write(filename, self.to_json(input))
+
+    def start_writers(self) -> None:
+        with self.writers_lock:
+            if not self.writers:
+                self.writers = [threading.Thread(target=self.write_queued, daemon=True) for _ in range(self.writer_threads)]
+                for writer in self.writers:
+                    writer.start()
+
+    def write_queued(self) -> None:
+        while (item := self.queue.get()) is not None:
+            try:
+                if self.error is None:  # once a write has failed, the remaining files are dropped
+                    self.file_writer.write(*item)
+            except Exception as e:
+                self.error = self.error or e
+            finally:
+                self.queue.task_done()
+        self.queue.task_done()
+
+    def raise_error(self) -> None:
+        if self.error is not None:
+            raise self.error
+
+    def flush(self) -> None:
+        if self.writers:
+            self.queue.join()
+            self.raise_error()
+        self.file_writer.flush()
+
+    def close(self) -> None:
+        try:
+            self.flush()
+        finally:
+            with self.writers_lock:
+                for _ in self.writers:
+                    self.queue.put(None)
+                for writer in self.writers:
+                    writer.join()
+                self.writers = []
+            self.file_writer.close()
+
+    def __enter__(self) -> "WriteJsonToFile":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
@@ -2,10 +2,13 @@
 # Authors: Christian Smith; John Azariah
 # All rights reserved.
 
+from copy import copy
 from functools import reduce, wraps
+from itertools import islice
 from dataclasses import dataclass
 from typing import Generic, TypeVar, Any
-from collections.abc import Iterable, Callable
+from collections.abc import Iterable, Iterator, Callable
+from concurrent.futures import Executor, Future, FIRST_COMPLETED, wait
 from abc import ABC, abstractmethod
 
 from generics import TypeAnnotatedMeta
@@ -21,6 +24,9 @@ TPipelineContext = TypeVar('TPipelineContext')
 
 TIgnore = TypeVar('TIgnore')
 
+# The maximum number of inputs that are submitted to an executor ahead of their results being collected
+MAX_PENDING_INPUTS = 64
+
 
 # Custom decorator to generate filename
 def to_filename(lambda_func):
@@ -28,9 +34,13 @@ def to_filename(lambda_func):
 
     This decorator injects a `filename` attribute into the dataclass instance, which will be generated using the provided lambda function.
     Do not specify the extension for the filename. The extension will be added automatically based on the file format by the pipeline.
+
+    The attribute is also injected by `__post_init__`, which `msgspec` calls when it decodes a dataclass (without calling `__init__`),
+    so that instances read from files, or returned by worker processes, have the same `filename` as the originals.
     """
     def decorator(cls):
         original_init = cls.__init__
+        original_post_init = getattr(cls, "__post_init__", None)
 
         @wraps(original_init)
         def new_init(self, *args, **kwargs):
@@ -38,11 +48,61 @@ def to_filename(lambda_func):
             # Generate the filename using the provided lambda function
             self.filename = lambda_func(self)
 
+        def new_post_init(self, *args):
+            if original_post_init is not None:
+                original_post_init(self, *args)
+            self.filename = lambda_func(self)
+
         cls.__init__ = new_init
+        cls.__post_init__ = new_post_init
         return cls
     return decorator
 
 
+def chunked(items: Iterable[Any], chunk_size: int) -> Iterator[list[Any]]:
+    """Lazily split `items` into lists of (at most) `chunk_size` items."""
+    iterator = iter(items)
+    while chunk := list(islice(iterator, chunk_size)):
+        yield chunk
+
+
+def map_on_executor(
+    function: Callable[[Any], Any], inputs: Iterable[Any], executor: Executor, ordered: bool = True, max_pending: int = MAX_PENDING_INPUTS
+) -> Iterator[Any]:
+    """Lazily map `function` over `inputs` on `executor`.
+
+    At most `max_pending` inputs are in flight at any time, so `inputs` may be an arbitrarily long (or lazy) iterable.
+    If `ordered` is set, results are yielded in the order of their inputs, otherwise they are yielded as soon as they complete.
+    """
+    pending: list[Future] = []
+
+    def next_completed() -> Future:
+        if ordered:
+            return pending.pop(0)
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        future = next(iter(done))
+        pending.remove(future)
+        return future
+
+    try:
+        for input in inputs:
+            pending.append(executor.submit(function, input))
+            if len(pending) >= max_pending:
+                yield next_completed().result()
+
+        while pending:
+            yield next_completed().result()
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+@dataclass
+class StageFailure:
+    """Carries an exception raised by a stage to the stages downstream of it, so that it surfaces to the caller of the pipeline."""
+    exception: BaseException
+
+
 # # Example usage
 # @to_filename(lambda obj: f"{obj.first_name}_{obj.last_name}_{obj.id}")
 # @dataclass
@@ -69,31 +129,143 @@ class PipelineStage(Generic[TStageInput, TStageResult], metaclass=TypeAnnotatedM
     def consume(self, result: TStageResult) -> None:
         return
 
+    # Optionally, override this with a method `transform_batch(self, inputs: Sequence[TStageInput]) -> Sequence[TStageResult]`
+    # which transforms a whole batch of inputs at once (e.g. with vectorized operations). This saves the per-item call
+    # overhead: in `benchmarks/bench_batch.py`, where it is a list comprehension, `BatchPipeline` runs about 2x faster
+    # than `Pipeline` (about 1.5x with batches of 16); more expensive per-item work leaves less to save.
+    transform_batch = None
+
+    # Set this to True if `transform` has no side effects and returns exactly one result for each input.
+    # Consecutive pure stages without `produce` or `consume` can then be fused together by `Pipeline.compile`.
+    pure = False
+
+    # Optionally, for pure stages, override this with a method `transform_one(self, input: TStageInput) -> TStageResult`
+    # which returns the single result of `transform` directly.
+    transform_one = None
+
+    # Change this whenever the logic of the stage changes, so that the results it cached (with a `CachedStage`, or in the
+    # `cache_directory` of a `FileSystemCoupledPipeline`) are not reused.
+    cache_version = ""
+
+    def source(self) -> Iterator[TStageResult]:
+        """Yield (and consume) the results of `produce`.
+
+        A stage is a *source* if its `produce` yields any results.
+        `produce` is invoked exactly once each time the stage is run over a sequence of inputs, no matter how many inputs there are.
+        """
+        for result in self.produce() if self.produce else []:
+            if self.consume:
+                self.consume(result)
+            yield result
+
+    def apply(self, input: TStageInput, passthrough: bool = True) -> Iterator[TStageResult]:
+        """Yield (and consume) the results of `transform` on a single input.
+
+        If `transform` yields nothing and `passthrough` is set, the input itself is yielded as the result.
+        """
+        empty = True
+        for result in self.transform(input) if self.transform else []:
+            empty = False
+            if self.consume:
+                self.consume(result)
+            yield result
+
+        if empty and passthrough:
+            if self.consume:
+                self.consume(input)
+            yield input
+
+    def map(
+        self, inputs: Iterable[TStageInput], passthrough: bool = True, executor: Executor | None = None, ordered: bool = True
+    ) -> Iterator[list[TStageResult]]:
+        """Apply the stage to each input in turn, yielding the list of results for each input.
+
+        If an `executor` is provided, the inputs are applied concurrently on it, and `consume` is called from the executor's workers.
+        If `ordered` is not set, the results of each input are yielded as soon as they are available rather than in input order.
+        """
+        def apply(input: TStageInput) -> list[TStageResult]:
+            return list(self.apply(input, passthrough))
+
+        if executor is None:
+            return map(apply, inputs)
+        return map_on_executor(apply, inputs, executor, ordered=ordered)
+
+    def process(self, inputs: Iterable[TStageInput], executor: Executor | None = None, ordered: bool = True) -> Iterator[TStageResult]:
+        """Lazily run the stage over a sequence of inputs.
+
+        The results of `produce` are yielded first, followed by the results of `transform` for each input in turn.
+        Inputs are only passed through unchanged if the stage is not a source.
+        If an `executor` is provided, the inputs are transformed concurrently on it (see `map`).
+        """
+        produced = False
+        for result in self.source():
+            produced = True
+            yield result
+
+        if executor is None:
+            for input in inputs:
+                yield from self.apply(input, passthrough=not produced)
+        else:
+            for results in self.map(inputs, passthrough=not produced, executor=executor, ordered=ordered):
+                yield from results
+
+    def process_batches(self, inputs: Iterable[TStageInput], batch_size: int) -> Iterator[TStageResult]:
+        """Lazily run the stage over a sequence of inputs, calling `transform_batch` on batches of (at most) `batch_size` inputs.
+
+        The results of `produce` are yielded first, followed by the results of `transform_batch` for each batch in turn.
+        Inputs are never passed through unchanged by `transform_batch`.
+        Stages which do not define `transform_batch` fall back to `process`, transforming each input in turn.
+        """
+        if not self.transform_batch:
+            yield from self.process(inputs)
+            return
+
+        yield from self.source()
+        for batch in chunked(inputs, batch_size):
+            for result in self.transform_batch(batch):
+                if self.consume:
+                    self.consume(result)
+                yield result
+
+    def stream(self, input: TStageInput) -> Iterator[TStageResult]:
+        """Lazily yield the results of running the stage on `input`, consuming each result as it is yielded."""
+        return self.process([input])
+
     def run(self, input: TStageInput) -> Iterable[TStageResult]:
-        produce_results = list(self.produce()) if self.produce else [input]
-        transform_results = list(self.transform(input)) if self.transform else []
-        results = produce_results + transform_results if produce_results or transform_results else [input]
-        if self.consume:
-            list(map(self.consume, results))
-        return results
+        return list(self.stream(input))
 
     def __call__(self, input: TStageInput) -> Iterable[TStageResult]:
         return self.run(input)
 
+    def is_fusible(self) -> bool:
+        """A stage can be fused with its neighbours if it is pure, and does not produce or consume."""
+        def overrides(name: str) -> bool:
+            return name in vars(self) or getattr(type(self), name) is not getattr(PipelineStage, name)
+
+        return bool(self.pure) and bool(self.transform) and not overrides("produce") and not overrides("consume")
+
     def __rshift__(self, other: "PipelineStage[TStageResult, TStageOther]") -> "PipelineStage[TStageInput, TStageOther]":
         if self.TStageResult != other.TStageInput:
             raise TypeError(
                 f"Output type of {self} ({self.TStageResult}) does not match input type of {other} ({other.TStageInput})."
             )
 
+        if self.is_fusible() and other.is_fusible():
+            return fuse([self, other])
+
         class CombinedStage(PipelineStage[self.TStageInput, other.TStageResult]):
-            def transform(_self, input: self.TStageInput) -> Iterable[TStageOther]:
-                """Sequentially transform data from both stages."""
-                intermediate_results = self.run(input)
-                final_results = []
-                for intermediate in intermediate_results:
-                    final_results.extend(other.run(intermediate))
-                return final_results
+            def source(_self) -> Iterator[TStageOther]:
+                """Run the results of `produce` of the first stage through the second, after the results of its own `produce`."""
+                return other.process(self.source())
+
+            def process(_self, inputs: Iterable[self.TStageInput], executor: Executor | None = None, ordered: bool = True) -> Iterator[TStageOther]:
+                """Sequentially run both stages, so that each stage produces exactly once."""
+                return other.process(self.process(inputs, executor, ordered), executor, ordered)
+
+            def apply(_self, input: self.TStageInput, passthrough: bool = True) -> Iterator[TStageOther]:
+                """Sequentially apply both stages to a single input."""
+                for intermediate in self.apply(input, passthrough):
+                    yield from other.apply(intermediate, passthrough)
 
         return CombinedStage()
 
@@ -103,6 +275,53 @@ class IdentityStage(PipelineStage[TStageInput, TStageInput]):
     transform: Callable[[TStageInput], Iterable[TStageInput]] = lambda x: [x]
 
 
+@dataclass
+class FusedStage(PipelineStage[TStageInput, TStageResult]):
+    """A single stage which runs a chain of pure stages, without materializing any intermediate results.
+
+    Use `fuse` or `Pipeline.compile` to create fused stages.
+    """
+    stages: list[PipelineStage[Any, Any]]
+
+    pure = True
+
+    def __post_init__(self):
+        # Generate a function which threads each input through the stages, with one call per stage
+        namespace = {}
+        lines = ["def fused(x):"]
+        for index, stage in enumerate(self.stages):
+            if stage.transform_one:
+                namespace[f"stage_{index}"] = stage.transform_one
+                lines.append(f"    x = stage_{index}(x)")
+            else:
+                namespace[f"stage_{index}"] = stage.transform
+                lines.append(f"    (x,) = stage_{index}(x)")
+        lines.append("    return x")
+        exec("\n".join(lines), namespace)
+        self.transform_one = namespace["fused"]
+
+    def transform(self, input: TStageInput) -> Iterable[TStageResult]:
+        return [self.transform_one(input)]
+
+    def process(self, inputs: Iterable[TStageInput], executor: Executor | None = None, ordered: bool = True) -> Iterator[TStageResult]:
+        if executor is None:
+            return map(self.transform_one, inputs)
+        return super().process(inputs, executor, ordered)
+
+    def __getstate__(self):
+        return {"stages": self.stages}
+
+    def __setstate__(self, state):
+        self.stages = state["stages"]
+        self.__post_init__()
+
+
+def fuse(stages: list[PipelineStage[Any, Any]]) -> FusedStage[Any, Any]:
+    """Fuse a chain of pure stages into a single stage."""
+    stages = [inner for stage in stages for inner in (stage.stages if isinstance(stage, FusedStage) else [stage])]
+    return FusedStage[stages[0].TStageInput, stages[-1].TStageResult](stages)
+
+
 class Pipeline(Generic[TPipelineInput, TPipelineResult], metaclass=TypeAnnotatedMeta):
     """This is a base class for a pipeline of stages
 
@@ -139,25 +358,90 @@ class Pipeline(Generic[TPipelineInput, TPipelineResult], metaclass=TypeAnnotated
         return stages_list
 
     def run(self, input: TPipelineInput) -> list[TPipelineResult]:
-        def flatten(nested_iterables: list[list[TPipelineResult]]) -> Iterable[TPipelineResult]:
-            for iterable in nested_iterables:
-                yield from iterable
-
         results = [input]
         for stage in self.stages:
-            results = list(flatten(stage(r) for r in results))
+            results = list(stage.process(results))
 
         return results
 
+    def stream(self, input: TPipelineInput) -> Iterator[TPipelineResult]:
+        """Lazily yield the results of the pipeline one at a time.
+
+        Stages are chained depth-first, so each result flows through every stage before the next one is produced.
+        Peak memory is bounded by the depth of the pipeline rather than by the widest stage.
+        The results are yielded in the same order as `run` returns them.
+        """
+        results = iter([input])
+        for stage in self.stages:
+            results = stage.process(results)
+
+        return results
+
+    def compile(self) -> "Pipeline[TPipelineInput, TPipelineResult]":
+        """Return a copy of this pipeline, in which each run of consecutive fusible stages is fused into a single stage.
+
+        See `PipelineStage.is_fusible` for which stages can be fused.
+        """
+        stages = []
+        for stage in self.stages:
+            if stages and stage.is_fusible() and stages[-1].is_fusible():
+                stages[-1] = fuse([stages[-1], stage])
+            else:
+                stages.append(stage)
+
+        compiled = copy(self)
+        compiled.stages = stages
+        return compiled
+
     def __call__(self, input: TPipelineInput) -> list[TPipelineResult]:
         return self.run(input)
 
 
+class StreamingPipeline(Pipeline[TPipelineInput, TPipelineResult]):
+    """A pipeline whose `run` lazily yields its results instead of returning a list.
+
+    Use this when a stage fans out to more results than can comfortably be held in memory.
+    """
+    def run(self, input: TPipelineInput) -> Iterator[TPipelineResult]:
+        return self.stream(input)
+
+
+class BatchPipeline(Pipeline[TPipelineInput, TPipelineResult]):
+    """A pipeline which groups the inputs of each stage into batches, and transforms each batch at once with `transform_batch`.
+
+    Stages which do not define `transform_batch` transform each input in turn, as in `Pipeline`.
+    Batches are formed lazily, so `stream` holds at most a batch per stage in memory.
+
+    Attributes:
+        batch_size (int):
+            The maximum number of inputs passed to `transform_batch` at a time.
+    """
+    def __init__(self, stages: Iterable[PipelineStage[Any, Any]] = None, batch_size: int = 1024):
+        super().__init__(stages)
+        self.batch_size = batch_size
+
+    def run(self, input: TPipelineInput) -> list[TPipelineResult]:
+        results = [input]
+        for stage in self.stages:
+            results = list(stage.process_batches(results, self.batch_size))
+
+        return results
+
+    def stream(self, input: TPipelineInput) -> Iterator[TPipelineResult]:
+        results = iter([input])
+        for stage in self.stages:
+            results = stage.process_batches(results, self.batch_size)
+
+        return results
+
+
 class PipelineStageEnhancer(ABC, Generic[TPipelineContext], metaclass=TypeAnnotatedMeta):
-    def __init__(self, stage: PipelineStage[Any, Any], stage_index: int, stage_count: int):
+    def __init__(self, stage: PipelineStage[Any, Any], stage_index: int, stage_count: int, executor: Executor | None = None, ordered: bool = True):
         self.stage = stage
         self.stage_index = stage_index
         self.stage_count = stage_count
+        self.executor = executor
+        self.ordered = ordered
 
     @abstractmethod
     def generate_inputs(self, context: TPipelineContext) -> Iterable[Any]:
@@ -167,18 +451,19 @@ class PipelineStageEnhancer(ABC, Generic[TPipelineContext], metaclass=TypeAnnota
     def process_output(self, context: TPipelineContext, result: Any, result_index: int, result_count: int) -> None:
         pass
 
+    def process_outputs(self, context: TPipelineContext, results: list[Any]) -> TPipelineContext:
+        """Process the results of a single input (or of `produce`)."""
+        result_count = len(results)
+        for index, result in enumerate(results, start=1):
+            self.process_output(context, result, result_index=index, result_count=result_count)
+        return context
+
     def run(self, context: TPipelineContext) -> TPipelineContext:
-        def process_outputs(context, results: list[Any]):
-            result_count = len(results)
-            for index, result in enumerate(results, start=1):
-                self.process_output(context, result, result_index=index, result_count=result_count)
-            return context
-
-        match list(self.stage.produce()):
-            case None | []:
-                return reduce(lambda ctx, input: process_outputs(ctx, self.stage(input)), list(self.generate_inputs(context)), context)
+        match list(self.stage.source()):
+            case []:
+                return reduce(self.process_outputs, self.stage.map(self.generate_inputs(context), executor=self.executor, ordered=self.ordered), context)
             case produce_results:
-                return process_outputs(context, produce_results)
+                return self.process_outputs(context, produce_results)
 
     def __call__(self, context: TPipelineContext) -> TPipelineContext:
         return self.run(context)
@@ -188,11 +473,13 @@ class PipelineStageEnhancer(ABC, Generic[TPipelineContext], metaclass=TypeAnnota
 class EnhancedPipeline(ABC, Generic[TPipelineStageAdapter, TPipelineContext], metaclass=TypeAnnotatedMeta):
     pipeline: Pipeline[Any, Any]
     context: TPipelineContext
+    executor: Executor | None = None
+    ordered: bool = True
 
     def __post_init__(self):
         stage_count = len(self.pipeline.stages)
         self.contextual_stages = [
-            self.TPipelineStageAdapter(stage, stage_index=index, stage_count=stage_count)
+            self.TPipelineStageAdapter(stage, stage_index=index, stage_count=stage_count, executor=self.executor, ordered=self.ordered)
             for index, stage in enumerate(self.pipeline.stages)
         ]
 
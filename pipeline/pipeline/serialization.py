@@ -0,0 +1,159 @@
+# Copyright (c) 2024 Contributors
+# Authors: Christian Smith; John Azariah
+# All rights reserved.
+
+import bz2
+import lzma
+import mmap
+import struct
+import zlib
+import msgspec
+from abc import ABC, abstractmethod
+from functools import lru_cache
+from typing import Any
+from collections.abc import Callable
+
+# The `struct` format of the length prefixed to each record in a binary segment
+RECORD_LENGTH = struct.Struct("<I")
+
+# The compressors which may be layered on top of a codec, by name
+COMPRESSIONS = {
+    "zlib": (zlib.compress, zlib.decompress),
+    "bz2": (bz2.compress, bz2.decompress),
+    "lzma": (lzma.compress, lzma.decompress),
+}
+
+
+@lru_cache
+def json_decoder(type: Any) -> msgspec.json.Decoder:
+    """Returns a (cached) JSON decoder for the given type, shared by all the stages decoding that type."""
+    return msgspec.json.Decoder(type, strict=False)
+
+
+@lru_cache
+def msgpack_decoder(type: Any) -> msgspec.msgpack.Decoder:
+    """Returns a (cached) MessagePack decoder for the given type, shared by all the stages decoding that type."""
+    return msgspec.msgpack.Decoder(type, strict=False)
+
+
+class Codec(ABC):
+    """Converts records to and from the bytes stored in the files (and segments) written by a pipeline stage.
+
+    Attributes:
+        name (str):
+            The name of the codec, as accepted by `get_codec`.
+        extension (str):
+            The extension of the files holding a single record.
+        segment_extension (str):
+            The extension of the segments holding a sequence of records.
+    """
+    name: str
+    extension: str
+
+    @property
+    def segment_extension(self) -> str:
+        return f"{self.extension}.seg"
+
+    @abstractmethod
+    def encode(self, record: Any) -> bytes:
+        pass
+
+    @abstractmethod
+    def decoder(self, type: type) -> Callable[[bytes], Any]:
+        """Returns a function decoding records of the given type, which is resolved once rather than for each record."""
+        pass
+
+    def decode(self, content: bytes, type: type) -> Any:
+        return self.decoder(type)(content)
+
+    def frame(self, record: bytes) -> bytes:
+        """Frame an encoded record so it can be appended to a segment. By default, records are prefixed with their length."""
+        return RECORD_LENGTH.pack(len(record)) + record
+
+    def split(self, content: bytes | mmap.mmap) -> list[memoryview]:
+        """Split the content of a segment into views of its encoded records, without copying them."""
+        view = memoryview(content)
+        records = []
+        offset = 0
+        while offset < len(view):
+            (length,) = RECORD_LENGTH.unpack_from(view, offset)
+            offset += RECORD_LENGTH.size
+            records.append(view[offset:offset + length])
+            offset += length
+        return records
+
+
+class JsonCodec(Codec):
+    """Stores records as compact JSON; segments hold one record per line (JSON Lines)."""
+    name = "json"
+    extension = ".json"
+    segment_extension = ".jsonl"
+
+    def __init__(self):
+        self.encoder = msgspec.json.Encoder()
+
+    def encode(self, record: Any) -> bytes:
+        return self.encoder.encode(record)
+
+    def decoder(self, type: type) -> Callable[[bytes], Any]:
+        return json_decoder(type).decode
+
+    def frame(self, record: bytes) -> bytes:
+        return record + b"\n"
+
+    def split(self, content: bytes | mmap.mmap) -> list[memoryview]:
+        view = memoryview(content)
+        records = []
+        offset = 0
+        while (end := content.find(b"\n", offset)) != -1:
+            records.append(view[offset:end])
+            offset = end + 1
+        if offset < len(view):
+            records.append(view[offset:])
+        return records
+
+
+class MsgpackCodec(Codec):
+    """Stores records as MessagePack, which is smaller and faster to parse than JSON."""
+    name = "msgpack"
+    extension = ".msgpack"
+
+    def __init__(self):
+        self.encoder = msgspec.msgpack.Encoder()
+
+    def encode(self, record: Any) -> bytes:
+        return self.encoder.encode(record)
+
+    def decoder(self, type: type) -> Callable[[bytes], Any]:
+        return msgpack_decoder(type).decode
+
+
+class CompressedCodec(Codec):
+    """Compresses each record encoded by another codec. Segments of compressed records are always length-prefixed."""
+    def __init__(self, codec: Codec, compression: str):
+        self.codec = codec
+        self.compress, self.decompress = COMPRESSIONS[compression]
+        self.name = f"{codec.name}+{compression}"
+        self.extension = f"{codec.extension}.{compression}"
+
+    def encode(self, record: Any) -> bytes:
+        return self.compress(self.codec.encode(record))
+
+    def decoder(self, type: type) -> Callable[[bytes], Any]:
+        decode = self.codec.decoder(type)
+        return lambda content: decode(self.decompress(content))
+
+
+CODECS = {codec.name: codec for codec in [JsonCodec, MsgpackCodec]}
+
+
+def get_codec(name: str) -> Codec:
+    """Create the codec with the given name: "json" or "msgpack", optionally followed by a compression, e.g. "msgpack+zlib"."""
+    codec_name, separator, compression = name.partition("+")
+    if codec_name not in CODECS or (separator and compression not in COMPRESSIONS):
+        raise ValueError(
+            f"Unknown codec {name!r}: expected one of {', '.join(CODECS)}, optionally followed by +{', +'.join(COMPRESSIONS)}."
+        )
+
+    codec = CODECS[codec_name]()
+    return CompressedCodec(codec, compression) if compression else codec
@@ -0,0 +1,127 @@
+import pytest
+import asyncio
+from collections.abc import Iterable, AsyncIterator
+from dataclasses import dataclass
+
+import sys
+import pathlib
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent.parent / "generics" / "generics"))
+from pipeline.pipeline import Pipeline, PipelineStage
+from pipeline.async_pipeline import AsyncPipelineStage, AsyncPipeline
+from test_pipeline import InitialStage, IntermediateStage, FinalStage
+
+
+@dataclass
+class FanOutStage(PipelineStage[int, int]):
+    def transform(self, input: int) -> Iterable[int]:
+        return range(input)
+
+
+@dataclass
+class AsyncDoubleStage(AsyncPipelineStage[int, int]):
+    async def transform(self, input: int) -> list[int]:
+        await asyncio.sleep(0.001 * (input % 3))
+        return [input * 2]
+
+
+@dataclass
+class AsyncGeneratorStage(AsyncPipelineStage[int, int]):
+    async def transform(self, input: int) -> AsyncIterator[int]:
+        yield input
+        await asyncio.sleep(0)
+        yield -input
+
+
+@dataclass
+class AsyncProduceStage(AsyncPipelineStage[int, int]):
+    async def produce(self) -> AsyncIterator[int]:
+        for i in range(3):
+            yield i
+
+
+@dataclass
+class ConcurrencyTrackingStage(AsyncPipelineStage[int, int]):
+    concurrency = 3
+
+    def __post_init__(self):
+        self.active = 0
+        self.peak = 0
+
+    async def transform(self, input: int) -> list[int]:
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        await asyncio.sleep(0.005)
+        self.active -= 1
+        return [input]
+
+
+def test_async_pipeline_with_sync_stages_matches_pipeline():
+    stages = [FanOutStage(), InitialStage(), IntermediateStage(), FinalStage()]
+
+    assert asyncio.run(AsyncPipeline[int, str](stages)(20)) == Pipeline[int, str](stages)(20)
+
+
+def test_async_pipeline_with_async_stages():
+    pipeline = AsyncPipeline[int, int]([FanOutStage(), AsyncDoubleStage(), AsyncGeneratorStage()])
+
+    assert asyncio.run(pipeline(3)) == [0, 0, 2, -2, 4, -4]
+
+
+def test_async_pipeline_with_async_produce():
+    pipeline = AsyncPipeline[int, int]([AsyncProduceStage(), AsyncDoubleStage()])
+
+    assert asyncio.run(pipeline(100)) == [0, 2, 4]
+
+
+def test_async_pipeline_unordered():
+    pipeline = AsyncPipeline[int, int]([FanOutStage(), AsyncDoubleStage()], ordered=False)
+
+    assert sorted(asyncio.run(pipeline(30))) == [2 * i for i in range(30)]
+
+
+def test_async_pipeline_respects_stage_concurrency():
+    stage = ConcurrencyTrackingStage()
+    pipeline = AsyncPipeline[int, int]([FanOutStage(), stage], concurrency=10)
+
+    assert asyncio.run(pipeline(12)) == list(range(12))
+    assert stage.peak == 3
+
+
+def test_async_pipeline_stream():
+    async def collect():
+        pipeline = AsyncPipeline[int, int]([FanOutStage(), AsyncDoubleStage()], queue_size=2)
+        return [result async for result in pipeline.stream(10)]
+
+    assert asyncio.run(collect()) == [2 * i for i in range(10)]
+
+
+def test_async_pipeline_consumes_results():
+    consumed_results = []
+
+    @dataclass
+    class AsyncConsumeStage(AsyncPipelineStage[int, int]):
+        async def consume(self, result: int) -> None:
+            consumed_results.append(result)
+
+    asyncio.run(AsyncPipeline[int, int]([FanOutStage(), AsyncConsumeStage()])(3))
+    assert consumed_results == [0, 1, 2]
+
+
+def test_async_pipeline_propagates_errors():
+    @dataclass
+    class FailingStage(AsyncPipelineStage[int, int]):
+        async def transform(self, input: int) -> list[int]:
+            if input == 5:
+                raise ValueError("bad input")
+            return [input]
+
+    pipeline = AsyncPipeline[int, int]([FanOutStage(), FailingStage(), AsyncDoubleStage()], queue_size=1)
+
+    with pytest.raises(ValueError, match="bad input"):
+        asyncio.run(pipeline(100))
+
+
+def test_async_pipeline_validates_stages():
+    with pytest.raises(TypeError):
+        AsyncPipeline[int, int]([FanOutStage(), IntermediateStage()])
@@ -0,0 +1,245 @@
+import multiprocessing
+import pickle
+import pytest
+from collections.abc import Callable, Iterable
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+
+import sys
+import pathlib
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent.parent / "generics" / "generics"))
+from pipeline.pipeline import Pipeline, PipelineStage, TStageInput, TStageResult, to_filename
+from pipeline.concurrent_pipeline import ThreadPoolPipeline
+from pipeline.caching import CachedStage, MemoryCache, DirectoryCache, SQLiteCache, memoize, memoized_stage, stage_fingerprint
+
+
+@dataclass
+class Square:
+    value: int
+    square: int
+
+
+@dataclass
+class SquareStage(PipelineStage[int, Square]):
+    offset: int = 0
+
+    def __post_init__(self):
+        self.calls = []
+
+    def transform(self, input: int) -> Iterable[Square]:
+        self.calls.append(input)
+        return [Square(input, input * input + self.offset)]
+
+
+@dataclass
+class DigitsStage(PipelineStage[str, int]):
+    def transform(self, input: str) -> Iterable[int]:
+        return [int(digit) for digit in input]
+
+
+@pytest.fixture(params=["memory", "directory", "sqlite"])
+def cache(request, tmp_path):
+    if request.param == "memory":
+        return MemoryCache()
+    if request.param == "directory":
+        return DirectoryCache(str(tmp_path / "cache"))
+    return SQLiteCache(str(tmp_path / "cache.db"))
+
+
+def test_cached_stage_skips_transform_on_hits(cache):
+    inner = SquareStage()
+    stage = memoize(inner, cache)
+    pipeline = Pipeline[int, Square](stages=[stage])
+
+    assert isinstance(stage, CachedStage)
+    assert pipeline.run(3) == [Square(3, 9)]
+    assert pipeline.run(3) == [Square(3, 9)]
+    assert pipeline.run(4) == [Square(4, 16)]
+    assert inner.calls == [3, 4]
+    assert (cache.stats.hits, cache.stats.misses) == (1, 2)
+    assert cache.stats.hit_rate == pytest.approx(1 / 3)
+
+
+def test_cached_stage_keys_on_stage_fields_and_version():
+    cache = MemoryCache()
+    assert memoize(SquareStage(), cache).transform(2) == [Square(2, 4)]
+    assert memoize(SquareStage(offset=1), cache).transform(2) == [Square(2, 5)]
+    assert memoize(SquareStage(), cache, version="2").transform(2) == [Square(2, 4)]
+    assert cache.stats.misses == 3
+
+    assert memoize(SquareStage(), cache).transform(2) == [Square(2, 4)]
+    assert cache.stats.hits == 1
+
+    SquareStage.cache_version = "2"
+    try:
+        assert memoize(SquareStage(), cache).transform(2) == [Square(2, 4)]
+    finally:
+        del SquareStage.cache_version
+    assert cache.stats.misses == 4
+
+
+class MultiplyStage(PipelineStage[int, int]):
+    """A stage configured in `__init__` rather than by dataclass fields."""
+    def __init__(self, factor: int):
+        self.factor = factor
+
+    def transform(self, input: int) -> Iterable[int]:
+        return [input * self.factor]
+
+
+@dataclass
+class ScaleStage(PipelineStage[TStageInput, TStageResult]):
+    factor: int
+
+    def transform(self, input):
+        return [input * self.factor]
+
+
+@dataclass
+class CallbackStage(PipelineStage[int, int]):
+    callback: Callable[[int], int]
+
+    def transform(self, input: int) -> Iterable[int]:
+        return [self.callback(input)]
+
+
+def test_cached_stage_keys_on_attributes_set_in_init():
+    cache = MemoryCache()
+    assert memoize(MultiplyStage(2), cache).transform(5) == [10]
+    assert memoize(MultiplyStage(3), cache).transform(5) == [15]
+    assert cache.stats.misses == 2
+
+
+def test_cached_stage_keys_on_fields_of_specialized_stages():
+    cache = MemoryCache()
+    assert memoize(ScaleStage[int, int](factor=2), cache).transform(5) == [10]
+    assert memoize(ScaleStage[int, int](factor=3), cache).transform(5) == [15]
+    assert memoize(ScaleStage[float, float](factor=3), cache).transform(5.0) == [15.0]
+    assert cache.stats.misses == 3
+
+    assert memoize(ScaleStage[int, int](factor=3), cache).transform(5) == [15]
+    assert cache.stats.hits == 1
+
+
+def test_cached_stage_keys_are_unaffected_by_the_state_of_the_stage():
+    stage = SquareStage()
+    cached_stage = memoize(stage)
+    assert cached_stage.transform(2) == [Square(2, 4)]
+    assert stage.calls == [2]
+    assert cached_stage.transform(2) == [Square(2, 4)]
+    assert cached_stage.cache.stats.hits == 1
+
+
+def test_cached_stage_rejects_stages_which_cannot_be_described():
+    with pytest.raises(TypeError, match="cannot be cached"):
+        memoize(CallbackStage(callback=abs))
+
+
+def test_stage_fingerprints_are_stable_across_processes():
+    stage = ScaleStage[int, int](factor=2)
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+        assert executor.submit(stage_fingerprint, stage, "1").result() == stage_fingerprint(stage, "1")
+    assert stage_fingerprint(ScaleStage[int, int](factor=2)) == stage_fingerprint(stage)
+
+
+def test_cached_stage_caches_results_lists():
+    stage = memoize(DigitsStage())
+    assert list(stage.transform("123")) == [1, 2, 3]
+    assert list(stage.transform("123")) == [1, 2, 3]
+    assert stage.cache.stats.hits == 1
+
+
+@to_filename(lambda document: f"doc_{document.id}")
+@dataclass
+class Document:
+    id: int
+
+
+@dataclass
+class DocumentStage(PipelineStage[int, Document]):
+    def transform(self, input: int) -> Iterable[Document]:
+        return [Document(input)]
+
+
+def test_cached_stage_hits_keep_filenames():
+    stage = memoize(DocumentStage())
+    miss, hit = stage.transform(1), stage.transform(1)
+
+    assert stage.cache.stats.hits == 1
+    assert [document.filename for document in hit] == [document.filename for document in miss] == ["doc_1"]
+
+
+def test_memory_cache_evicts_least_recently_used_results():
+    cache = MemoryCache(max_bytes=10)
+    cache.put("a", b"aaaa")
+    cache.put("b", b"bbbb")
+    assert cache.get("a") == b"aaaa"
+    cache.put("c", b"cccc")
+
+    assert cache.get("b") is None
+    assert cache.get("a") == b"aaaa" and cache.get("c") == b"cccc"
+    assert cache.stats.evictions == 1
+    assert cache.size == 8
+
+
+@pytest.mark.parametrize("cache_type", [DirectoryCache, SQLiteCache])
+def test_persistent_caches_are_shared_across_runs(tmp_path, cache_type):
+    path = str(tmp_path / "cache")
+    memoize(SquareStage(), cache_type(path)).transform(5)
+
+    inner = SquareStage()
+    cache = pickle.loads(pickle.dumps(cache_type(path)))
+    assert memoize(inner, cache).transform(5) == [Square(5, 25)]
+    assert inner.calls == []
+    assert cache.stats.hits == 1
+
+
+def test_memoized_stage_decorator_caches_every_instance():
+    @memoized_stage(version="1")
+    @dataclass
+    class TripleStage(PipelineStage[int, int]):
+        def transform(self, input: int) -> Iterable[int]:
+            return [input * 3]
+
+    pipeline = ThreadPoolPipeline[int, int](stages=[TripleStage()])
+    assert pipeline.run(2) == [6]
+    assert Pipeline[int, int](stages=[TripleStage()]).run(2) == [6]
+    assert (TripleStage.result_cache.stats.hits, TripleStage.result_cache.stats.misses) == (1, 1)
+
+
+@memoized_stage()
+@dataclass
+class MemoizedScaleStage(PipelineStage[int, int]):
+    factor: int = 2
+
+    def transform(self, input: int) -> Iterable[int]:
+        return [input * self.factor]
+
+
+@dataclass
+class MemoizedScaleSubclassStage(MemoizedScaleStage):
+    label: str = ""
+
+
+@dataclass
+@memoized_stage()
+class MemoizedBeforeDataclassStage(PipelineStage[int, int]):
+    factor: int = 2
+
+    def transform(self, input: int) -> Iterable[int]:
+        return [input * self.factor]
+
+
+def test_memoized_stage_decorator_caches_instances_of_subclasses():
+    assert MemoizedScaleStage(factor=3).transform(5) == [15]
+    assert MemoizedScaleSubclassStage(factor=3).transform(5) == [15]
+    assert MemoizedScaleSubclassStage(factor=4).transform(5) == [20]
+    assert MemoizedScaleSubclassStage(factor=4).transform(5) == [20]
+    assert (MemoizedScaleStage.result_cache.stats.hits, MemoizedScaleStage.result_cache.stats.misses) == (1, 3)
+
+
+def test_memoized_stage_decorator_applied_before_dataclass():
+    assert MemoizedBeforeDataclassStage(factor=3).transform(5) == [15]
+    assert MemoizedBeforeDataclassStage(factor=3).transform(5) == [15]
+    assert MemoizedBeforeDataclassStage.result_cache.stats.hits == 1
@@ -0,0 +1,109 @@
+import gc
+import pytest
+from collections.abc import Iterable
+from dataclasses import dataclass
+from msgspec import Struct
+
+import sys
+import pathlib
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent.parent / "generics" / "generics"))
+np = pytest.importorskip("numpy")
+from pipeline.pipeline import Pipeline, BatchPipeline, PipelineStage
+from pipeline.columnar import ColumnarBatch, to_columns, from_columns
+
+
+@dataclass
+class Reading:
+    sensor: int
+    value: float
+
+
+class Enriched(Struct):
+    sensor: int
+    value: float
+    scaled: float
+
+
+@dataclass
+class ReadingsStage(PipelineStage[int, Reading]):
+    def transform(self, input: int) -> Iterable[Reading]:
+        return (Reading(sensor=i, value=i / 4) for i in range(input))
+
+
+@dataclass
+class EnrichStage(PipelineStage[ColumnarBatch[Reading], ColumnarBatch[Enriched]]):
+    def transform(self, input: ColumnarBatch[Reading]) -> Iterable[ColumnarBatch[Enriched]]:
+        yield ColumnarBatch[Enriched]({"sensor": input["sensor"], "value": input["value"], "scaled": input["value"] * 10})
+
+
+def test_columnar_batch_round_trip():
+    records = [Reading(sensor=1, value=0.5), Reading(sensor=2, value=1.5)]
+    batch = ColumnarBatch[Reading].from_records(records)
+
+    assert len(batch) == 2
+    assert batch["sensor"].dtype.kind == "i"
+    assert np.array_equal(batch["value"], np.array([0.5, 1.5]))
+    assert batch.to_records() == records
+
+
+def test_columnar_batch_of_structs():
+    records = [Enriched(sensor=1, value=0.5, scaled=5.0)]
+
+    assert ColumnarBatch[Enriched].from_records(records).to_records() == records
+
+
+def test_columnar_batch_concatenate():
+    batches = [ColumnarBatch[Reading].from_records([Reading(sensor=i, value=i / 2)]) for i in range(3)]
+    batch = ColumnarBatch[Reading].concatenate(batches)
+
+    assert batch.to_records() == [Reading(sensor=i, value=i / 2) for i in range(3)]
+
+
+def test_columnar_batch_rejects_ragged_columns():
+    with pytest.raises(ValueError):
+        ColumnarBatch[Reading]({"sensor": [1, 2], "value": [0.5]})
+
+
+def test_columnar_batch_rejects_non_record_types():
+    with pytest.raises(TypeError):
+        ColumnarBatch[int].from_records([1, 2])
+
+
+def test_columnar_stages_are_type_checked():
+    with pytest.raises(TypeError):
+        Pipeline[int, Enriched]([ReadingsStage(), EnrichStage(), from_columns(Enriched)])
+
+    with pytest.raises(TypeError):
+        Pipeline[int, Enriched]([ReadingsStage(), to_columns(Enriched), EnrichStage(), from_columns(Enriched)])
+
+
+def test_columnar_pipeline():
+    stages = [ReadingsStage(), to_columns(Reading), EnrichStage(), from_columns(Enriched)]
+    expected = [Enriched(sensor=i, value=i / 4, scaled=i * 2.5) for i in range(10)]
+
+    assert Pipeline[int, Enriched](stages)(10) == expected
+    assert BatchPipeline[int, Enriched](stages, batch_size=4)(10) == expected
+
+
+def test_columnar_stages_are_type_checked_after_many_specializations():
+    to_readings = to_columns(Reading)
+    for i in range(2000):
+        ColumnarBatch[dataclass(type(f"Dynamic{i}", (), {"__annotations__": {"value": int}}))]
+    gc.collect()
+
+    stages = [ReadingsStage(), to_readings, EnrichStage(), from_columns(Enriched)]
+    assert Pipeline[int, Enriched](stages)(2) == [Enriched(sensor=i, value=i / 4, scaled=i * 2.5) for i in range(2)]
+
+
+def test_batch_pipeline_passes_whole_column_blocks():
+    batch_sizes = []
+
+    @dataclass
+    class BatchSizeStage(PipelineStage[ColumnarBatch[Reading], ColumnarBatch[Reading]]):
+        def transform(self, input: ColumnarBatch[Reading]) -> Iterable[ColumnarBatch[Reading]]:
+            batch_sizes.append(len(input))
+            yield input
+
+    BatchPipeline[int, Reading]([ReadingsStage(), to_columns(Reading), BatchSizeStage(), from_columns(Reading)], batch_size=4)(10)
+    assert batch_sizes == [4, 4, 2]
@@ -0,0 +1,325 @@
+import os
+import pytest
+import threading
+import time
+from collections.abc import Iterable
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any
+from msgspec import Struct
+
+import sys
+import pathlib
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent.parent / "generics" / "generics"))
+from pipeline.pipeline import Pipeline, PipelineStage, TStageInput, TStageResult, to_filename
+from pipeline.concurrent_pipeline import ThreadPoolPipeline, ProcessPoolPipeline, StageParallelPipeline
+from test_pipeline import InitialStage, IntermediateStage, FinalStage, CustomStage
+from test_enhanced_pipeline import DictCoupledPipeline
+
+
+@dataclass
+class FanOutStage(PipelineStage[int, int]):
+    def transform(self, input: int) -> Iterable[int]:
+        return range(input)
+
+
+@dataclass
+class SlowStage(PipelineStage[int, int]):
+    def transform(self, input: int) -> Iterable[int]:
+        time.sleep(0.001 * (input % 5))
+        yield input * 2
+
+
+@dataclass
+class BarrierStage(PipelineStage[int, int]):
+    """A stage that can only complete if `parties` inputs are transformed at the same time."""
+    parties: int
+
+    def __post_init__(self):
+        self.barrier = threading.Barrier(self.parties, timeout=5)
+
+    def transform(self, input: int) -> Iterable[int]:
+        self.barrier.wait()
+        yield input
+
+
+def test_thread_pool_pipeline_matches_pipeline():
+    stages = [FanOutStage(), SlowStage(), InitialStage(), IntermediateStage(), FinalStage()]
+
+    assert ThreadPoolPipeline[int, str](stages, max_workers=4)(50) == Pipeline[int, str](stages)(50)
+
+
+def test_thread_pool_pipeline_runs_inputs_concurrently():
+    pipeline = ThreadPoolPipeline[int, int]([FanOutStage(), BarrierStage(parties=4)], max_workers=4)
+
+    assert pipeline(4) == [0, 1, 2, 3]
+
+
+def test_thread_pool_pipeline_unordered():
+    pipeline = ThreadPoolPipeline[int, int]([FanOutStage(), SlowStage()], max_workers=4, ordered=False)
+
+    assert sorted(pipeline(100)) == [2 * i for i in range(100)]
+
+
+def test_thread_pool_pipeline_produces_once():
+    produce_calls = []
+
+    def produce():
+        produce_calls.append(1)
+        return [100]
+
+    stage = CustomStage[int, int](produce=produce, transform=lambda x: [x * 2])
+    pipeline = ThreadPoolPipeline[int, int]([FanOutStage(), stage], max_workers=4)
+
+    assert pipeline(3) == [100, 0, 2, 4]
+    assert len(produce_calls) == 1
+
+
+def test_thread_pool_pipeline_propagates_errors():
+    def fail(x: int) -> list[int]:
+        raise ValueError(f"bad input {x}")
+
+    pipeline = ThreadPoolPipeline[int, int]([FanOutStage(), CustomStage[int, int](transform=fail)], max_workers=4)
+
+    with pytest.raises(ValueError):
+        pipeline(10)
+
+
+def test_thread_pool_pipeline_streams_on_the_thread_pool():
+    pipeline = ThreadPoolPipeline[int, int]([FanOutStage(), BarrierStage(parties=4)], max_workers=4)
+
+    assert list(pipeline.stream(4)) == [0, 1, 2, 3]
+
+
+def test_enhanced_pipeline_with_executor():
+    pipeline = Pipeline[int, int]([BarrierStage(parties=3), SlowStage()])
+
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        contextual_pipeline = DictCoupledPipeline(context={"initial_inputs": [1, 2, 3]}, pipeline=pipeline, executor=executor)
+        result_context = contextual_pipeline.run()
+
+    assert result_context["stage_1"] == [1, 2, 3]
+    assert result_context["stage_2"] == [2, 4, 6]
+
+
+@dataclass
+class SquareStage(PipelineStage[int, int]):
+    def transform(self, input: int) -> Iterable[int]:
+        yield input * input
+
+
+class GenericOffsetStage(PipelineStage[TStageInput, TStageResult]):
+    def transform(self, input):
+        yield input + 1
+
+
+class Reading(Struct):
+    sensor: str
+    value: float
+
+
+@dataclass
+class ReadingStage(PipelineStage[int, Reading]):
+    def transform(self, input: int) -> Iterable[Reading]:
+        yield Reading(sensor=f"sensor_{input}", value=input / 2)
+
+
+@dataclass
+class SourceStage(PipelineStage[int, int]):
+    def produce(self) -> Iterable[int]:
+        return [-1]
+
+    def transform(self, input: int) -> Iterable[int]:
+        yield input
+
+
+def test_process_pool_pipeline_matches_pipeline():
+    stages = [FanOutStage(), SquareStage(), InitialStage(), IntermediateStage(), FinalStage()]
+
+    assert ProcessPoolPipeline[int, str](stages, max_workers=2, chunk_size=7)(50) == Pipeline[int, str](stages)(50)
+
+
+def test_process_pool_pipeline_with_runtime_specialized_stage():
+    pipeline = ProcessPoolPipeline[int, int]([FanOutStage(), GenericOffsetStage[int, int]()], max_workers=2, chunk_size=3)
+
+    assert pipeline(10) == list(range(1, 11))
+
+
+def test_process_pool_pipeline_decodes_structured_results():
+    pipeline = ProcessPoolPipeline[int, Reading]([FanOutStage(), ReadingStage()], max_workers=2, chunk_size=2)
+
+    assert pipeline(3) == [Reading("sensor_0", 0.0), Reading("sensor_1", 0.5), Reading("sensor_2", 1.0)]
+
+
+def test_process_pool_pipeline_unordered():
+    pipeline = ProcessPoolPipeline[int, int]([FanOutStage(), SquareStage()], max_workers=2, chunk_size=4, ordered=False)
+
+    assert sorted(pipeline(100)) == [i * i for i in range(100)]
+
+
+@dataclass
+class ProcessIdStage(PipelineStage[int, int]):
+    def transform(self, input: int) -> Iterable[int]:
+        yield os.getpid()
+
+
+def test_process_pool_pipeline_streams_on_the_process_pool():
+    pipeline = ProcessPoolPipeline[int, int]([FanOutStage(), ProcessIdStage()], max_workers=2, chunk_size=2)
+
+    process_ids = list(pipeline.stream(6))
+    assert len(process_ids) == 6
+    assert os.getpid() not in process_ids
+
+
+@to_filename(lambda document: f"doc_{document.id}")
+@dataclass
+class Document:
+    id: int
+
+
+@dataclass
+class DocumentStage(PipelineStage[int, Document]):
+    def transform(self, input: int) -> Iterable[Document]:
+        yield Document(input)
+
+
+def test_process_pool_pipeline_results_keep_filenames():
+    stages = [FanOutStage(), DocumentStage()]
+    results = ProcessPoolPipeline[int, Document](stages, max_workers=2, chunk_size=2)(3)
+
+    assert [document.filename for document in results] == [document.filename for document in Pipeline[int, Document](stages)(3)]
+    assert [document.filename for document in results] == ["doc_0", "doc_1", "doc_2"]
+
+
+def test_process_pool_pipeline_produces_once():
+    pipeline = ProcessPoolPipeline[int, int]([FanOutStage(), SourceStage()], max_workers=2, chunk_size=2)
+
+    assert pipeline(5) == [-1, 0, 1, 2, 3, 4]
+
+
+@dataclass
+class SignalStage(PipelineStage[int, int]):
+    """Signals when it starts transforming its second input."""
+    started: Any
+
+    def transform(self, input: int) -> Iterable[int]:
+        if input == 1:
+            self.started.set()
+        yield input
+
+
+@dataclass
+class AwaitSignalStage(PipelineStage[int, int]):
+    """Waits for the upstream stage to start on its second input before finishing its first input."""
+    started: Any
+
+    def transform(self, input: int) -> Iterable[int]:
+        if input == 0:
+            assert self.started.wait(timeout=5), "The upstream stage should be running concurrently."
+        yield input
+
+
+def test_stage_parallel_pipeline_matches_pipeline():
+    stages = [FanOutStage(), SquareStage(), InitialStage(), IntermediateStage(), FinalStage()]
+
+    assert StageParallelPipeline[int, str](stages, queue_size=4)(50) == Pipeline[int, str](stages)(50)
+
+
+def test_stage_parallel_pipeline_runs_stages_concurrently():
+    started = threading.Event()
+    pipeline = StageParallelPipeline[int, int]([FanOutStage(), SignalStage(started), AwaitSignalStage(started)])
+
+    assert pipeline(3) == [0, 1, 2]
+
+
+def test_stage_parallel_pipeline_applies_backpressure():
+    produced = []
+
+    @dataclass
+    class CountingFanOutStage(PipelineStage[int, int]):
+        def transform(self, input: int) -> Iterable[int]:
+            for i in range(input):
+                produced.append(i)
+                yield i
+
+    pipeline = StageParallelPipeline[int, int]([CountingFanOutStage(), SquareStage()], queue_size=2)
+    results = pipeline.stream(1_000_000)
+
+    assert [next(results) for _ in range(3)] == [0, 1, 4]
+    time.sleep(0.2)
+    assert len(produced) < 10, "A fast stage should block when the queue to the next stage is full."
+    results.close()
+
+
+def test_stage_parallel_pipeline_produces_once():
+    pipeline = StageParallelPipeline[int, int]([FanOutStage(), SourceStage()])
+
+    assert pipeline(5) == [-1, 0, 1, 2, 3, 4]
+
+
+def test_stage_parallel_pipeline_propagates_errors():
+    def fail(x: int) -> list[int]:
+        raise ValueError(f"bad input {x}")
+
+    pipeline = StageParallelPipeline[int, int]([FanOutStage(), CustomStage[int, int](transform=fail), SquareStage()], queue_size=1)
+
+    with pytest.raises(ValueError):
+        pipeline(100)
+
+
+def test_stage_parallel_pipeline_with_process_workers():
+    stages = [FanOutStage(), SquareStage(), GenericOffsetStage[int, int]()]
+
+    assert StageParallelPipeline[int, int](stages, workers="process")(20) == [i * i + 1 for i in range(20)]
+
+
+@dataclass
+class UnpicklableResultStage(PipelineStage[int, int]):
+    def transform(self, input: int) -> Iterable[Any]:
+        return [lambda: input]
+
+
+@dataclass
+class CrashingStage(PipelineStage[int, int]):
+    def transform(self, input: int) -> Iterable[int]:
+        os._exit(3)
+
+
+def test_stage_parallel_pipeline_with_process_workers_raises_pickling_errors():
+    with pytest.raises(Exception, match="pickle"):
+        StageParallelPipeline[int, int]([UnpicklableResultStage()], workers="process")(1)
+
+
+def test_stage_parallel_pipeline_with_process_workers_raises_when_a_worker_dies():
+    with pytest.raises(RuntimeError, match="exit code 3"):
+        StageParallelPipeline[int, int]([CrashingStage(), SquareStage()], workers="process")(1)
+
+
+@dataclass
+class LargeFanOutStage(PipelineStage[int, str]):
+    def transform(self, input: int) -> Iterable[str]:
+        for i in range(input):
+            yield str(i) * 100_000
+
+
+@dataclass
+class SlowCopyStage(PipelineStage[str, str]):
+    def transform(self, input: str) -> Iterable[str]:
+        time.sleep(0.01)
+        yield input
+
+
+def test_stage_parallel_pipeline_with_process_workers_can_be_closed_early():
+    results = StageParallelPipeline[int, str]([LargeFanOutStage(), SlowCopyStage()], queue_size=32, workers="process").stream(40)
+    assert len(next(results)) == 100_000
+
+    closer = threading.Thread(target=results.close, daemon=True)
+    closer.start()
+    closer.join(timeout=30)
+    assert not closer.is_alive(), "Closing the stream early should stop the stage workers."
+
+
+def test_stage_parallel_pipeline_rejects_unknown_workers():
+    with pytest.raises(ValueError):
+        StageParallelPipeline[int, int]([SquareStage()], workers="fibers")
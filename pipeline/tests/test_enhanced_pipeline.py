@@ -85,3 +85,41 @@ def test_pipeline_with_consume_only_stage():
     assert result_context["stage_2"] == ["10", "20"], "ContextualPipeline should correctly process intermediate stage outputs."
     assert result_context["stage_3"] == ["10", "20"], "ContextualPipeline should correctly process final stage outputs."
     assert collector.result == ", 10, 20", "ConsumeOnlyStage should correctly consume final stage outputs."
+
+
+def test_produce_function_is_called_once_per_stage():
+    produce_calls = []
+
+    @dataclass
+    class CountingProduceStage(PipelineStage[int, int]):
+        def produce(self):
+            produce_calls.append(1)
+            return []
+
+        def transform(self, x: int) -> list[int]:
+            return [x + 1]
+
+    pipeline = Pipeline[int, int]([CountingProduceStage()])
+    contextual_pipeline = DictCoupledPipeline(context={"initial_inputs": [1, 2, 3]}, pipeline=pipeline)
+    result_context = contextual_pipeline.run()
+
+    assert result_context["stage_1"] == [2, 3, 4]
+    assert len(produce_calls) == 1, "An enhanced stage should only produce once, regardless of how many inputs it receives."
+
+
+def test_contextual_pipeline_with_combined_source_stage():
+    @dataclass
+    class SourceStage(PipelineStage[int, int]):
+        def produce(self) -> Iterable[int]:
+            return [100, 200]
+
+    @dataclass
+    class DoubleStage(PipelineStage[int, int]):
+        def transform(self, input: int) -> Iterable[int]:
+            return [input * 2]
+
+    pipeline = Pipeline[int, int]([SourceStage() >> DoubleStage()])
+    result_context = DictCoupledPipeline(context={"initial_inputs": [2]}, pipeline=pipeline).run()
+
+    assert result_context["stage_1"] == [200, 400], "The results of produce should flow through the combined stage."
+    assert result_context["stage_1"] == pipeline.run(2)
@@ -0,0 +1,97 @@
+import gc
+import os
+import pickle
+import pytest
+
+import sys
+import pathlib
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent.parent / "generics" / "generics"))
+from pipeline.file_writer import FileWriter
+
+
+@pytest.mark.parametrize("durability", ["none", "file"])
+def test_file_writer_replaces_files_atomically(tmp_path, durability):
+    writer = FileWriter(durability)
+    writer.write(str(tmp_path / "a.json"), b"old")
+    writer.write(str(tmp_path / "a.json"), b"new")
+
+    assert (tmp_path / "a.json").read_bytes() == b"new"
+    assert [path.name for path in tmp_path.iterdir()] == ["a.json"]
+
+
+def test_file_writer_with_group_durability_renames_files_once_synced(tmp_path):
+    writer = FileWriter("group", group_size=3, group_interval=60)
+    for name in ["a", "b"]:
+        writer.write(str(tmp_path / f"{name}.json"), name.encode())
+    assert not list(tmp_path.glob("*.json")), "Files should only appear once their group has been synced."
+
+    writer.write(str(tmp_path / "c.json"), b"c")
+    writer.write(str(tmp_path / "d.json"), b"d")
+    assert sorted(path.name for path in tmp_path.glob("*.json")) == ["a.json", "b.json", "c.json"]
+
+    writer.close()
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["a.json", "b.json", "c.json", "d.json"]
+
+
+def test_file_writer_with_group_durability_syncs_groups_after_interval(tmp_path):
+    writer = FileWriter("group", group_size=100, group_interval=0)
+    writer.write(str(tmp_path / "a.json"), b"a")
+    assert (tmp_path / "a.json").read_bytes() == b"a"
+
+
+def test_file_writer_removes_temporary_file_on_failure(tmp_path):
+    with pytest.raises(TypeError):
+        FileWriter().write(str(tmp_path / "a.json"), "not bytes")
+    assert not list(tmp_path.iterdir())
+
+
+def test_file_writer_rejects_unknown_durability():
+    with pytest.raises(ValueError):
+        FileWriter("always")
+
+
+def test_file_writer_can_be_pickled():
+    writer = pickle.loads(pickle.dumps(FileWriter("group", group_size=8)))
+    assert (writer.durability, writer.group_size, writer.group) == ("group", 8, [])
+
+
+@pytest.mark.parametrize("durability", ["none", "file", "group"])
+def test_file_writer_writes_relative_to_its_folder(tmp_path, monkeypatch, durability):
+    writer = FileWriter(durability, folder=str(tmp_path / "out"))
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr("os.makedirs", lambda *args, **kwargs: pytest.fail("The folder should only be created once."))
+
+    writer.write("a.json", b"a")
+    writer.write("b.json", b"b")
+    writer.close()
+
+    assert sorted(path.name for path in (tmp_path / "out").iterdir()) == ["a.json", "b.json"]
+    assert not (tmp_path / "a.json").exists()
+
+
+def test_file_writer_with_folder_can_be_pickled(tmp_path):
+    writer = pickle.loads(pickle.dumps(FileWriter(folder=str(tmp_path / "out"))))
+    writer.write("a.json", b"a")
+    writer.close()
+    assert (tmp_path / "out" / "a.json").read_bytes() == b"a"
+
+
+@pytest.mark.skipif(not os.path.isdir("/proc/self/fd"), reason="Open file descriptors can only be counted through /proc.")
+def test_file_writers_release_their_folder_once_collected(tmp_path):
+    gc.collect()
+    open_fds = len(os.listdir("/proc/self/fd"))
+    for _ in range(100):
+        FileWriter(folder=str(tmp_path)).write("a.json", b"a")
+    gc.collect()
+
+    assert len(os.listdir("/proc/self/fd")) <= open_fds
+
+
+def test_file_writer_closes_its_folder_once(tmp_path):
+    writer = FileWriter(folder=str(tmp_path))
+    writer.close()
+    writer.close()
+
+    assert writer.dir_fd is None
+    assert writer.dir_fd_finalizer is None or not writer.dir_fd_finalizer.alive
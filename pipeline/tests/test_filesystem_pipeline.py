@@ -1,15 +1,20 @@
+import mmap
+import os
 import pytest
 import shutil
+import msgspec
 
 from collections.abc import Iterable
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 
 import sys
 import pathlib
 sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
 sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent.parent / "generics" / "generics"))
-from pipeline.pipeline import Pipeline, PipelineStage, to_filename
-from pipeline.filesystem_coupled_pipeline import FileSystemCoupledPipeline
+from pipeline.pipeline import Pipeline, PipelineStage, TStageInput, TStageResult, to_filename
+from pipeline.caching import stage_fingerprint
+from pipeline.filesystem_coupled_pipeline import FileSystemCoupledPipeline, FileSystemEnhancer, FileSystemContext, OutputCache, read_file
+from pipeline.serialization import JsonCodec
 
 
 @to_filename(lambda obj: f"{obj.id}")
@@ -70,3 +75,410 @@ def test_filesystem_pipeline(clear_directory):
 
     contextual_pipeline = FileSystemCoupledPipeline(document_root="test_document_root", pipeline=pipeline)
     contextual_pipeline.run()
+
+
+def read_stage(document_root, stage_index: int, type: type) -> list:
+    folder = pathlib.Path(document_root) / f"stage_{stage_index}"
+    return sorted((msgspec.json.decode(path.read_bytes(), type=type) for path in folder.glob("*.json")), key=lambda item: item.id)
+
+
+def test_filesystem_pipeline_writes_stage_outputs(tmp_path):
+    pipeline = Pipeline[None, None]([ProduceOnlyStageEx(), IntermediateStageEx(), IntermediateStage2Ex(), FinalStageEx()])
+    FileSystemCoupledPipeline(document_root=str(tmp_path), pipeline=pipeline).run()
+
+    assert read_stage(tmp_path, 1, Initial) == [Initial(id=i, value=i) for i in [1, 2, 3]]
+    assert read_stage(tmp_path, 2, Intermediate) == [Intermediate(id=i, value=str(i)) for i in [1, 2, 3]]
+    assert read_stage(tmp_path, 3, Intermediate2) == [Intermediate2(id=i, value=f"{i}_{i}") for i in [1, 2, 3]]
+
+
+def test_filesystem_pipeline_with_read_ahead(tmp_path):
+    pipeline = Pipeline[None, None]([ProduceOnlyStageEx(), IntermediateStageEx(), IntermediateStage2Ex(), FinalStageEx()])
+    FileSystemCoupledPipeline(document_root=str(tmp_path), pipeline=pipeline, read_ahead=2).run()
+
+    assert read_stage(tmp_path, 3, Intermediate2) == [Intermediate2(id=i, value=f"{i}_{i}") for i in [1, 2, 3]]
+
+
+def test_filesystem_enhancer_generates_inputs_lazily(tmp_path, monkeypatch):
+    (tmp_path / "stage_1").mkdir()
+    for i in range(100):
+        (tmp_path / "stage_1" / f"{i}.json").write_bytes(msgspec.json.encode(Initial(id=i, value=i)))
+
+    decoded = []
+    original_decode = FileSystemEnhancer.decode_inputs
+
+    def counting_decode(self, contents):
+        for input in original_decode(self, contents):
+            decoded.append(input)
+            yield input
+
+    monkeypatch.setattr(FileSystemEnhancer, "decode_inputs", counting_decode)
+    enhancer = FileSystemEnhancer(IntermediateStageEx(), stage_index=1, stage_count=2)
+    inputs = enhancer.generate_inputs(FileSystemContext(document_root=str(tmp_path), read_ahead=4))
+
+    next(inputs)
+    assert len(decoded) == 1, "Input files should be decoded one at a time, as they are needed."
+    inputs.close()
+
+
+def read_segments(document_root, stage_index: int, type: type) -> list:
+    folder = pathlib.Path(document_root) / f"stage_{stage_index}"
+    lines = [line for path in sorted(folder.glob("*.jsonl")) for line in path.read_bytes().splitlines()]
+    return sorted((msgspec.json.decode(line, type=type) for line in lines), key=lambda item: item.id)
+
+
+def test_filesystem_pipeline_with_segments(tmp_path):
+    pipeline = Pipeline[None, None]([ProduceOnlyStageEx(), IntermediateStageEx(), IntermediateStage2Ex(), FinalStageEx()])
+    FileSystemCoupledPipeline(document_root=str(tmp_path), pipeline=pipeline, layout="segments").run()
+
+    assert not list(tmp_path.glob("stage_*/*.json"))
+    assert read_segments(tmp_path, 1, Initial) == [Initial(id=i, value=i) for i in [1, 2, 3]]
+    assert read_segments(tmp_path, 3, Intermediate2) == [Intermediate2(id=i, value=f"{i}_{i}") for i in [1, 2, 3]]
+
+
+@dataclass
+class ProduceManyStageEx(PipelineStage[None, Initial]):
+    def produce(self) -> Iterable[Initial]:
+        return [Initial(id=i, value=i) for i in range(10)]
+
+
+def test_filesystem_pipeline_rolls_segments_over_by_size(tmp_path):
+    pipeline = Pipeline[None, Intermediate2]([ProduceManyStageEx(), IntermediateStageEx(), IntermediateStage2Ex()])
+    FileSystemCoupledPipeline(document_root=str(tmp_path), pipeline=pipeline, layout="segments", segment_size=64).run()
+
+    assert len(list((tmp_path / "stage_3").glob("segment_*.jsonl"))) > 1
+    assert all(path.stat().st_size <= 64 for path in (tmp_path / "stage_3").glob("segment_*.jsonl"))
+    assert read_segments(tmp_path, 3, Intermediate2) == [Intermediate2(id=i, value=f"{i}_{i}") for i in range(10)]
+
+
+def test_filesystem_pipeline_replaces_stale_segments(tmp_path):
+    pipeline = Pipeline[None, Intermediate]([ProduceOnlyStageEx(), IntermediateStageEx()])
+    for _ in range(2):
+        FileSystemCoupledPipeline(document_root=str(tmp_path), pipeline=pipeline, layout="segments").run()
+
+    assert read_segments(tmp_path, 2, Intermediate) == [Intermediate(id=i, value=str(i)) for i in [1, 2, 3]]
+
+
+def test_filesystem_context_rejects_unknown_layout():
+    with pytest.raises(ValueError):
+        FileSystemContext(document_root="unused", layout="tables")
+
+
+@pytest.mark.parametrize("layout", ["files", "segments"])
+def test_filesystem_pipeline_with_msgpack_codec(tmp_path, layout):
+    pipeline = Pipeline[None, None]([ProduceOnlyStageEx(), IntermediateStageEx(), IntermediateStage2Ex(), FinalStageEx()])
+    FileSystemCoupledPipeline(document_root=str(tmp_path), pipeline=pipeline, layout=layout, codec="msgpack+zlib").run()
+
+    assert (tmp_path / "stage_2" / ".codec").read_text() == "msgpack+zlib"
+    assert not list(tmp_path.glob("stage_*/*.json*"))
+    enhancer = FileSystemEnhancer(FinalStageEx(), stage_index=3, stage_count=4)
+    assert sorted(enhancer.generate_inputs(FileSystemContext(document_root=str(tmp_path))), key=lambda item: item.id) == [
+        Intermediate2(id=i, value=f"{i}_{i}") for i in [1, 2, 3]
+    ]
+
+
+def test_filesystem_pipeline_reads_inputs_with_recorded_codec(tmp_path):
+    pipeline = Pipeline[None, Intermediate]([ProduceOnlyStageEx(), IntermediateStageEx()])
+    FileSystemCoupledPipeline(document_root=str(tmp_path), pipeline=pipeline, codec="msgpack").run()
+
+    shutil.copytree(tmp_path / "stage_1", tmp_path / "rerun" / "stage_0")
+    rerun = Pipeline[Initial, Intermediate]([IntermediateStageEx()])
+    FileSystemCoupledPipeline(document_root=str(tmp_path / "rerun"), pipeline=rerun, codec="json").run()
+
+    assert read_stage(tmp_path / "rerun", 1, Intermediate) == [Intermediate(id=i, value=str(i)) for i in [1, 2, 3]]
+
+
+def test_filesystem_context_rejects_unknown_codec():
+    with pytest.raises(ValueError):
+        FileSystemContext(document_root="unused", codec="yaml")
+
+
+def test_read_file_memory_maps_large_files(tmp_path):
+    path = tmp_path / "data.json"
+    path.write_bytes(b"0123456789")
+
+    assert read_file(str(path), mmap_threshold=100) == b"0123456789"
+    assert isinstance(read_file(str(path)), bytes)
+    mapped = read_file(str(path), mmap_threshold=10)
+    assert isinstance(mapped, mmap.mmap) and mapped[:] == b"0123456789"
+
+
+@pytest.mark.parametrize("layout,codec", [("files", "json"), ("segments", "json"), ("segments", "msgpack+zlib")])
+def test_filesystem_pipeline_with_memory_mapped_inputs(tmp_path, layout, codec):
+    pipeline = Pipeline[None, None]([ProduceOnlyStageEx(), IntermediateStageEx(), IntermediateStage2Ex(), FinalStageEx()])
+    FileSystemCoupledPipeline(document_root=str(tmp_path), pipeline=pipeline, layout=layout, codec=codec, mmap_threshold=1).run()
+
+    enhancer = FileSystemEnhancer(FinalStageEx(), stage_index=3, stage_count=4)
+    context = FileSystemContext(document_root=str(tmp_path), mmap_threshold=1)
+    assert sorted(enhancer.generate_inputs(context), key=lambda item: item.id) == [Intermediate2(id=i, value=f"{i}_{i}") for i in [1, 2, 3]]
+
+
+@pytest.mark.parametrize("layout", ["files", "segments"])
+def test_filesystem_pipeline_with_io_workers(tmp_path, layout):
+    pipeline = Pipeline[None, Intermediate2]([ProduceManyStageEx(), IntermediateStageEx(), IntermediateStage2Ex()])
+    FileSystemCoupledPipeline(document_root=str(tmp_path), pipeline=pipeline, layout=layout, io_workers=4, max_in_flight=2).run()
+
+    read = read_stage if layout == "files" else read_segments
+    assert read(tmp_path, 3, Intermediate2) == [Intermediate2(id=i, value=f"{i}_{i}") for i in range(10)]
+
+
+def test_filesystem_pipeline_with_io_workers_appends_segments_in_order(tmp_path):
+    pipeline = Pipeline[None, Initial]([ProduceManyStageEx()])
+    FileSystemCoupledPipeline(document_root=str(tmp_path), pipeline=pipeline, layout="segments", io_workers=4, max_in_flight=3).run()
+
+    lines = (tmp_path / "stage_1" / "segment_000001.jsonl").read_bytes().splitlines()
+    assert [msgspec.json.decode(line, type=Initial).id for line in lines] == list(range(10))
+
+
+@dataclass
+class Unencodable:
+    id: int
+    value: object
+
+
+@dataclass
+class ProduceUnencodableStageEx(PipelineStage[None, Unencodable]):
+    def produce(self) -> Iterable[Unencodable]:
+        return [Unencodable(id=i, value=object()) for i in range(3)]
+
+
+def test_filesystem_pipeline_with_io_workers_raises_write_errors(tmp_path):
+    pipeline = Pipeline[None, Unencodable]([ProduceUnencodableStageEx()])
+    with pytest.raises(TypeError):
+        FileSystemCoupledPipeline(document_root=str(tmp_path), pipeline=pipeline, io_workers=2).run()
+
+
+@dataclass
+class CountingStageEx(PipelineStage[Initial, Intermediate]):
+    transformed: list = None
+    fail_on: int | None = None
+
+    def transform(self, input: Initial) -> Iterable[Intermediate]:
+        if input.id == self.fail_on:
+            raise RuntimeError(f"Failed on {input.id}")
+        self.transformed.append(input.id)
+        yield Intermediate(id=input.id, value=str(input.value))
+
+
+@dataclass
+class CountingStage2Ex(PipelineStage[Intermediate, Intermediate2]):
+    transformed: list = None
+
+    def transform(self, input: Intermediate) -> Iterable[Intermediate2]:
+        self.transformed.append(input.id)
+        yield Intermediate2(id=input.id, value=f"{input.value}_{input.value}")
+
+
+def seed_inputs(document_root, count: int) -> None:
+    (document_root / "stage_0").mkdir(parents=True)
+    for i in range(count):
+        (document_root / "stage_0" / f"{i}.json").write_bytes(msgspec.json.encode(Initial(id=i, value=i)))
+
+
+@pytest.mark.parametrize("io_workers", [0, 2])
+def test_filesystem_pipeline_resumes_without_reprocessing(tmp_path, io_workers):
+    seed_inputs(tmp_path, 5)
+    first, second = [], []
+
+    def run():
+        pipeline = Pipeline[Initial, Intermediate2]([CountingStageEx(transformed=first), CountingStage2Ex(transformed=second)])
+        FileSystemCoupledPipeline(document_root=str(tmp_path), pipeline=pipeline, resume=True, io_workers=io_workers).run()
+
+    run()
+    assert (sorted(first), sorted(second)) == (list(range(5)), list(range(5)))
+
+    first.clear()
+    second.clear()
+    run()
+    assert (first, second) == ([], [])
+
+    (tmp_path / "stage_0" / "3.json").write_bytes(msgspec.json.encode(Initial(id=3, value=30)))
+    (tmp_path / "stage_2" / "1.json").unlink()
+    run()
+    assert (first, sorted(second)) == ([3], [1, 3])
+    assert read_stage(tmp_path, 2, Intermediate2)[3] == Intermediate2(id=3, value="30_30")
+
+
+def test_filesystem_pipeline_resumes_after_failure(tmp_path):
+    seed_inputs(tmp_path, 10)
+    transformed = []
+
+    pipeline = Pipeline[Initial, Intermediate]([CountingStageEx(transformed=transformed, fail_on=9)])
+    with pytest.raises(RuntimeError):
+        FileSystemCoupledPipeline(document_root=str(tmp_path), pipeline=pipeline, resume=True).run()
+
+    completed = set(transformed)
+    transformed.clear()
+    pipeline = Pipeline[Initial, Intermediate]([CountingStageEx(transformed=transformed)])
+    FileSystemCoupledPipeline(document_root=str(tmp_path), pipeline=pipeline, resume=True).run()
+
+    assert completed.isdisjoint(transformed)
+    assert sorted(completed.union(transformed)) == list(range(10))
+
+
+def test_filesystem_context_rejects_resuming_segments():
+    with pytest.raises(ValueError):
+        FileSystemContext(document_root="unused", layout="segments", resume=True)
+
+
+@pytest.mark.parametrize("layout", ["files", "segments"])
+@pytest.mark.parametrize("durability", ["none", "file", "group"])
+def test_filesystem_pipeline_with_durability(tmp_path, layout, durability):
+    pipeline = Pipeline[None, Intermediate2]([ProduceManyStageEx(), IntermediateStageEx(), IntermediateStage2Ex()])
+    FileSystemCoupledPipeline(document_root=str(tmp_path), pipeline=pipeline, layout=layout, durability=durability, group_size=3, io_workers=2).run()
+
+    read = read_stage if layout == "files" else read_segments
+    assert read(tmp_path, 3, Intermediate2) == [Intermediate2(id=i, value=f"{i}_{i}") for i in range(10)]
+    assert not list(tmp_path.glob("stage_*/*.tmp"))
+
+
+def test_filesystem_context_rejects_unknown_durability():
+    with pytest.raises(ValueError):
+        FileSystemContext(document_root="unused", durability="always")
+
+
+def test_filesystem_enhancer_prepares_output_folder_once(tmp_path, monkeypatch):
+    makedirs = []
+    original_makedirs = os.makedirs
+    monkeypatch.setattr(os, "makedirs", lambda *args, **kwargs: makedirs.append(args) or original_makedirs(*args, **kwargs))
+
+    pipeline = Pipeline[None, Initial]([ProduceManyStageEx()])
+    FileSystemCoupledPipeline(document_root=str(tmp_path), pipeline=pipeline).run()
+
+    assert len(list((tmp_path / "stage_1").glob("*.json"))) == 10
+    assert len(makedirs) <= 2, "The output folder should be created once per stage run, not once per result."
+
+
+def test_filesystem_pipeline_with_fan_out(tmp_path):
+    pipeline = Pipeline[None, Intermediate2]([ProduceManyStageEx(), IntermediateStageEx(), IntermediateStage2Ex()])
+    FileSystemCoupledPipeline(document_root=str(tmp_path), pipeline=pipeline, fan_out=2).run()
+
+    paths = list((tmp_path / "stage_3").rglob("*.json"))
+    assert len(paths) == 10
+    assert all(len(path.relative_to(tmp_path / "stage_3").parts) == 3 for path in paths)
+    assert sorted((msgspec.json.decode(path.read_bytes(), type=Intermediate2) for path in paths), key=lambda item: item.id) == [
+        Intermediate2(id=i, value=f"{i}_{i}") for i in range(10)
+    ]
+
+
+def test_filesystem_pipeline_with_fan_out_resumes(tmp_path):
+    seed_inputs(tmp_path, 5)
+    transformed = []
+    for _ in range(2):
+        pipeline = Pipeline[Initial, Intermediate]([CountingStageEx(transformed=transformed)])
+        FileSystemCoupledPipeline(document_root=str(tmp_path), pipeline=pipeline, fan_out=1, resume=True).run()
+
+    assert sorted(transformed) == list(range(5))
+
+
+@dataclass
+class CachedCountingStageEx(PipelineStage[Initial, Intermediate]):
+    transformed: list = field(default=None, compare=False)
+
+    def transform(self, input: Initial) -> Iterable[Intermediate]:
+        self.transformed.append(input.id)
+        yield Intermediate(id=input.id, value=str(input.value))
+
+
+@pytest.mark.parametrize("io_workers", [0, 2])
+def test_filesystem_pipeline_shares_cached_outputs_across_document_roots(tmp_path, io_workers):
+    cache_directory = str(tmp_path / "cache")
+    transformed = []
+
+    def run(document_root, **options):
+        pipeline = Pipeline[Initial, Intermediate]([CachedCountingStageEx(transformed=transformed)])
+        FileSystemCoupledPipeline(document_root=str(document_root), pipeline=pipeline, cache_directory=cache_directory, io_workers=io_workers, **options).run()
+
+    seed_inputs(tmp_path / "day_1", 5)
+    run(tmp_path / "day_1")
+    assert sorted(transformed) == list(range(5))
+
+    shutil.copytree(tmp_path / "day_1" / "stage_0", tmp_path / "day_2" / "stage_0")
+    (tmp_path / "day_2" / "stage_0" / "3.json").write_bytes(msgspec.json.encode(Initial(id=3, value=30)))
+    transformed.clear()
+    run(tmp_path / "day_2", fan_out=1)
+
+    assert transformed == [3]
+    assert read_stage(tmp_path / "day_2", 1, Intermediate) == []  # the outputs are in the `fan_out` subfolders
+    outputs = {path.name: path for path in (tmp_path / "day_2" / "stage_1").rglob("*.json")}
+    assert msgspec.json.decode(outputs["3.json"].read_bytes(), type=Intermediate) == Intermediate(id=3, value="30")
+    assert os.path.samefile(outputs["1.json"], tmp_path / "day_1" / "stage_1" / "1.json"), "Cached outputs should be hard-linked."
+    assert not list((tmp_path / "cache").rglob("*.tmp"))
+
+
+def test_filesystem_pipeline_cache_is_keyed_on_stage_version(tmp_path):
+    seed_inputs(tmp_path, 3)
+    transformed = []
+
+    def run():
+        pipeline = Pipeline[Initial, Intermediate]([CachedCountingStageEx(transformed=transformed)])
+        FileSystemCoupledPipeline(document_root=str(tmp_path), pipeline=pipeline, cache_directory=str(tmp_path / "cache")).run()
+
+    run()
+    run()
+    assert sorted(transformed) == list(range(3))
+
+    CachedCountingStageEx.cache_version = "2"
+    try:
+        run()
+    finally:
+        del CachedCountingStageEx.cache_version
+    assert sorted(transformed) == sorted(list(range(3)) * 2)
+
+
+@dataclass
+class ScaleStageEx(PipelineStage[TStageInput, TStageResult]):
+    factor: int
+    transformed: list = field(default_factory=list, compare=False)
+
+    def transform(self, input):
+        self.transformed.append(input.id)
+        yield Initial(id=input.id, value=input.value * self.factor)
+
+
+def test_filesystem_pipeline_cache_is_keyed_on_stage_configuration(tmp_path):
+    cache_directory = str(tmp_path / "cache")
+    seed_inputs(tmp_path / "day_1", 3)
+    shutil.copytree(tmp_path / "day_1" / "stage_0", tmp_path / "day_2" / "stage_0")
+    for document_root, factor in [("day_1", 2), ("day_2", 3)]:
+        stage = ScaleStageEx[Initial, Initial](factor=factor)
+        FileSystemCoupledPipeline(document_root=str(tmp_path / document_root), pipeline=Pipeline[Initial, Initial]([stage]), cache_directory=cache_directory).run()
+        assert sorted(stage.transformed) == list(range(3)), "Differently configured stages should not share cached outputs."
+
+    assert read_stage(tmp_path / "day_1", 1, Initial) == [Initial(id=i, value=i * 2) for i in range(3)]
+    assert read_stage(tmp_path / "day_2", 1, Initial) == [Initial(id=i, value=i * 3) for i in range(3)]
+
+
+def test_filesystem_pipeline_cache_ignores_leftover_entries(tmp_path):
+    seed_inputs(tmp_path, 3)
+    cache_directory = str(tmp_path / "cache")
+    stage = CachedCountingStageEx(transformed=[])
+    cache = OutputCache(cache_directory, stage_fingerprint(stage))
+    for path in (tmp_path / "stage_0").glob("*.json"):
+        # as left behind by an interrupted run of a process with the same id
+        os.makedirs(f"{cache.entry(cache.key(JsonCodec(), JsonCodec(), str(path)))}.{os.getpid()}.tmp")
+
+    for _ in range(2):
+        FileSystemCoupledPipeline(document_root=str(tmp_path), pipeline=Pipeline[Initial, Intermediate]([stage]), cache_directory=cache_directory).run()
+
+    assert sorted(stage.transformed) == list(range(3))
+    assert read_stage(tmp_path, 1, Intermediate) == [Intermediate(id=i, value=str(i)) for i in range(3)]
+
+
+def test_filesystem_pipeline_cache_with_resume(tmp_path):
+    seed_inputs(tmp_path / "day_1", 3)
+    shutil.copytree(tmp_path / "day_1" / "stage_0", tmp_path / "day_2" / "stage_0")
+    transformed = []
+    for document_root in ["day_1", "day_2", "day_2"]:
+        pipeline = Pipeline[Initial, Intermediate]([CachedCountingStageEx(transformed=transformed)])
+        FileSystemCoupledPipeline(
+            document_root=str(tmp_path / document_root), pipeline=pipeline, cache_directory=str(tmp_path / "cache"), resume=True, durability="group"
+        ).run()
+
+    assert sorted(transformed) == list(range(3))
+    assert read_stage(tmp_path / "day_2", 1, Intermediate) == [Intermediate(id=i, value=str(i)) for i in range(3)]
+    assert "1.json" in (tmp_path / "day_2" / "stage_1" / ".manifest").read_text()
+
+
+def test_filesystem_context_rejects_caching_segments():
+    with pytest.raises(ValueError):
+        FileSystemContext(document_root="unused", layout="segments", cache_directory="unused")
@@ -1,5 +1,9 @@
-
 import json
+import pickle
+import shutil
+import pytest
+import msgspec
+from dataclasses import dataclass
 from msgspec import Struct
 
 import sys
@@ -105,3 +109,157 @@ def test_write_json_to_file_to_json_unicode_characters():
     stage = WriteJsonToFile(target_directory=".")
     expected_json = json.dumps({"data": "test data with unicode: üñîçødë"}, indent=4).encode("utf-8")
     assert stage.to_json(input_data) == expected_json
+
+
+class WriteMockJsonToFile(WriteJsonToFile):
+    def get_filename(self, input: MockInput) -> str:
+        return "mock_file"
+
+
+def test_write_json_to_file_consume_with_group_durability(tmp_path):
+    stage = WriteMockJsonToFile(target_directory=str(tmp_path), durability="group", group_size=10)
+    stage.consume(MockInput(data="test data"))
+    assert not (tmp_path / "mock_file.json").exists()
+
+    stage.flush()
+    assert json.loads((tmp_path / "mock_file.json").read_bytes()) == {"data": "test data"}
+    assert [path.name for path in tmp_path.iterdir()] == ["mock_file.json"]
+
+
+@dataclass
+class MockRecord:
+    id: int
+    name: str
+
+
+class WriteRecordJsonToFile(WriteJsonToFile):
+    def get_filename(self, input: MockRecord) -> str:
+        return f"record_{input.id}"
+
+
+def test_write_json_to_file_to_json_dataclass():
+    stage = WriteJsonToFile(target_directory=".")
+    assert stage.to_json(MockRecord(id=1, name="one")) == json.dumps({"id": 1, "name": "one"}, indent=4, sort_keys=True).encode("utf-8")
+
+
+@pytest.mark.parametrize("input_data", [MockInput(data="üñîçødë"), MockRecord(id=1, name="one")])
+def test_write_json_to_file_fast_mode_to_json(input_data):
+    stage = WriteJsonToFile(target_directory=".", mode="fast")
+    assert stage.to_json(input_data) == msgspec.json.encode(input_data)
+
+
+def test_write_json_to_file_fast_mode_consume_reuses_buffer(tmp_path):
+    stage = WriteRecordJsonToFile(target_directory=str(tmp_path), mode="fast")
+    stage.consume(MockRecord(id=1, name="a much longer name than the next one"))
+    buffer = stage.buffers.buffer
+    stage.consume(MockRecord(id=2, name="short"))
+
+    assert stage.buffers.buffer is buffer
+    assert msgspec.json.decode((tmp_path / "record_1.json").read_bytes(), type=MockRecord) == MockRecord(id=1, name="a much longer name than the next one")
+    assert msgspec.json.decode((tmp_path / "record_2.json").read_bytes(), type=MockRecord) == MockRecord(id=2, name="short")
+
+
+def test_write_json_to_file_fast_mode_can_be_pickled(tmp_path):
+    stage = pickle.loads(pickle.dumps(WriteRecordJsonToFile(target_directory=str(tmp_path), mode="fast")))
+    stage.consume(MockRecord(id=1, name="one"))
+    assert (tmp_path / "record_1.json").read_bytes() == b'{"id":1,"name":"one"}'
+
+
+def test_write_json_to_file_rejects_unknown_mode():
+    with pytest.raises(ValueError):
+        WriteJsonToFile(target_directory=".", mode="compact")
+
+
+def test_write_json_to_file_with_writer_threads(tmp_path):
+    with WriteRecordJsonToFile(target_directory=str(tmp_path), mode="fast", writer_threads=2, queue_size=4) as stage:
+        for i in range(20):
+            stage.consume(MockRecord(id=i, name=str(i)))
+
+    assert stage.writers == []
+    assert sorted(path.name for path in tmp_path.iterdir()) == sorted(f"record_{i}.json" for i in range(20))
+
+
+def test_write_json_to_file_with_writer_threads_flush_waits_for_queued_files(tmp_path):
+    stage = WriteRecordJsonToFile(target_directory=str(tmp_path), writer_threads=1)
+    stage.consume(MockRecord(id=1, name="one"))
+    stage.flush()
+    assert json.loads((tmp_path / "record_1.json").read_bytes()) == {"id": 1, "name": "one"}
+    stage.close()
+
+
+@pytest.mark.parametrize("writer_threads", [0, 2])
+def test_write_json_to_file_close_releases_the_target_directory(tmp_path, writer_threads):
+    with WriteRecordJsonToFile(target_directory=str(tmp_path), writer_threads=writer_threads) as stage:
+        stage.consume(MockRecord(id=1, name="one"))
+
+    assert stage.file_writer.dir_fd is None
+    assert json.loads((tmp_path / "record_1.json").read_bytes()) == {"id": 1, "name": "one"}
+
+
+def test_write_json_to_file_with_writer_threads_raises_write_errors(tmp_path):
+    stage = WriteRecordJsonToFile(target_directory=str(tmp_path / "out"), writer_threads=1)
+    shutil.rmtree(tmp_path / "out")
+    stage.consume(MockRecord(id=1, name="one"))
+
+    with pytest.raises(FileNotFoundError):
+        stage.flush()
+    with pytest.raises(FileNotFoundError):
+        stage.consume(MockRecord(id=2, name="two"))
+    with pytest.raises(FileNotFoundError):
+        stage.close()
+    assert stage.writers == []
+
+
+def test_format_print_to_console_consume_prints_each_input(capsys):
+    stage = FormatPrintToConsole()
+    stage.consume(MockInput(data="one"))
+    assert capsys.readouterr().out == "one\n"
+    stage.consume(MockInput(data="two"))
+    assert capsys.readouterr().out == "two\n"
+
+
+def test_format_print_to_console_writes_batches(capsys, monkeypatch):
+    writes = []
+    original_write = sys.stdout.write
+    monkeypatch.setattr(sys.stdout, "write", lambda text: writes.append(text) or original_write(text))
+
+    with FormatPrintToConsole(batch_size=3) as stage:
+        for data in ["a", "b"]:
+            stage.consume(MockInput(data=data))
+        assert writes == []
+
+        for data in ["c", "d"]:
+            stage.consume(MockInput(data=data))
+        assert writes == ["a\nb\nc\n"]
+
+    assert writes == ["a\nb\nc\n", "d\n"]
+    assert capsys.readouterr().out == "a\nb\nc\nd\n"
+
+
+def test_format_print_to_console_writes_after_flush_interval(capsys):
+    stage = FormatPrintToConsole(batch_size=100, flush_interval=0)
+    stage.consume(MockInput(data="a"))
+    assert capsys.readouterr().out == "a\n"
+
+
+def test_format_print_to_console_samples_inputs(capsys):
+    with FormatPrintToConsole(batch_size=10, sample_every=3) as stage:
+        for i in range(1, 8):
+            stage.consume(MockInput(data=str(i)))
+
+    assert capsys.readouterr().out == "1\n4\n7\n"
+    assert stage.count == 7
+    assert stage.throughput() > 0
+
+
+@pytest.mark.parametrize("options", [{"batch_size": 0}, {"sample_every": 0}, {"sample_every": -1}])
+def test_format_print_to_console_rejects_invalid_options(options):
+    with pytest.raises(ValueError):
+        FormatPrintToConsole(**options)
+
+
+def test_format_print_to_console_can_be_pickled(capsys):
+    stage = FormatPrintToConsole(batch_size=2)
+    stage.consume(MockInput(data="a"))
+    copy = pickle.loads(pickle.dumps(stage))
+    assert (copy.lines, copy.count, copy.batch_size) == ([], 0, 2)
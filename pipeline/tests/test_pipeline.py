@@ -1,12 +1,13 @@
 import pytest
+import pickle
 from dataclasses import dataclass
-from collections.abc import Iterable
+from collections.abc import Iterable, Sequence
 
 import sys
 import pathlib
 sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
 sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent.parent / "generics" / "generics"))
-from pipeline.pipeline import PipelineStage, Pipeline, TStageInput, TStageResult
+from pipeline.pipeline import PipelineStage, Pipeline, StreamingPipeline, BatchPipeline, FusedStage, TStageInput, TStageResult
 
 
 @dataclass
@@ -411,3 +412,233 @@ def test_composed_stage_in_pipeline():
     result = pipeline(3)
 
     assert result == ["Value: 6"]
+
+
+def test_pipeline_stream_matches_run():
+    stage1 = CustomStage[int, int](produce=lambda: [1, 2], transform=lambda x: [x + 1])
+    stage2 = CustomStage[int, int](transform=lambda x: [x, x * 10])
+    stage3 = CustomStage[int, str](transform=lambda x: [f"Value: {x}"])
+    pipeline = Pipeline[int, str]([stage1, stage2, stage3])
+
+    assert list(pipeline.stream(5)) == pipeline.run(5)
+
+
+def test_pipeline_stream_is_lazy():
+    transformed = []
+
+    @dataclass
+    class FanOutStage(PipelineStage[int, int]):
+        def transform(self, x: int) -> Iterable[int]:
+            for i in range(x):
+                transformed.append(i)
+                yield i
+
+    pipeline = Pipeline[int, int]([FanOutStage(), InitialStage()])
+    results = pipeline.stream(1_000_000)
+
+    assert next(results) == 0
+    assert next(results) == 2
+    assert transformed == [0, 1], "Streaming should only pull as many items as have been requested."
+
+
+def test_pipeline_stream_consumes_results_in_order():
+    consumed_results = []
+    stage1 = CustomStage[int, int](transform=lambda x: [x, x + 1])
+    stage2 = CustomStage[int, int](consume=lambda r: consumed_results.append(r))
+    pipeline = Pipeline[int, int]([stage1, stage2])
+
+    assert list(pipeline.stream(1)) == [1, 2]
+    assert consumed_results == [1, 2]
+
+
+def test_streaming_pipeline_validates_stages():
+    with pytest.raises(TypeError):
+        StreamingPipeline[int, int]([InitialStage(), IntermediateStage()])
+
+
+def test_streaming_pipeline_run_yields_results():
+    pipeline = StreamingPipeline[int, str]([InitialStage(), IntermediateStage(), FinalStage()])
+    results = pipeline(10)
+
+    assert not isinstance(results, list)
+    assert list(results) == ["20"]
+
+
+def test_produce_is_called_once_per_pipeline_run():
+    produce_calls = []
+
+    def produce():
+        produce_calls.append(1)
+        return [100]
+
+    stage1 = CustomStage[int, int](transform=lambda x: [x, x + 1, x + 2])
+    stage2 = CustomStage[int, int](produce=produce, transform=lambda x: [x * 2])
+    pipeline = Pipeline[int, int]([stage1, stage2])
+
+    assert pipeline(1) == [100, 2, 4, 6]
+    assert len(produce_calls) == 1, "A stage should only produce once, regardless of how many inputs it receives."
+
+    produce_calls.clear()
+    assert list(pipeline.stream(1)) == [100, 2, 4, 6]
+    assert len(produce_calls) == 1, "A streaming stage should only produce once, regardless of how many inputs it receives."
+
+
+def test_source_stage_does_not_pass_inputs_through():
+    stage1 = CustomStage[int, int](transform=lambda x: [x, x + 1])
+    stage2 = CustomStage[int, int](produce=lambda: [7])
+    pipeline = Pipeline[int, int]([stage1, stage2])
+
+    assert pipeline(1) == [7]
+
+
+def test_combined_stage_produces_once():
+    produce_calls = []
+
+    def produce():
+        produce_calls.append(1)
+        return ["injected"]
+
+    stage1 = CustomStage[int, int](transform=lambda x: [x, x * 2])
+    stage2 = CustomStage[int, str](produce=produce, transform=lambda x: [f"Processed: {x}"])
+
+    combined_stage = stage1 >> stage2
+    result = list(combined_stage(4))
+
+    assert result == ["injected", "Processed: 4", "Processed: 8"]
+    assert len(produce_calls) == 1
+
+
+@dataclass
+class BatchDoublingStage(PipelineStage[int, int]):
+    batch_sizes = None
+
+    def transform_batch(self, inputs: Sequence[int]) -> Sequence[int]:
+        self.batch_sizes = (self.batch_sizes or []) + [len(inputs)]
+        return [2 * x for x in inputs]
+
+
+@dataclass
+class RangeStage(PipelineStage[int, int]):
+    def transform(self, x: int) -> Iterable[int]:
+        return range(x)
+
+
+def test_batch_pipeline_calls_transform_batch():
+    stage = BatchDoublingStage()
+    pipeline = BatchPipeline[int, int]([RangeStage(), stage], batch_size=4)
+
+    assert pipeline(10) == [2 * i for i in range(10)]
+    assert stage.batch_sizes == [4, 4, 2]
+
+
+def test_batch_pipeline_falls_back_to_transform():
+    pipeline = BatchPipeline[int, str]([RangeStage(), BatchDoublingStage(), InitialStage(), IntermediateStage()], batch_size=3)
+
+    assert pipeline(5) == Pipeline[int, str]([RangeStage(), InitialStage(), InitialStage(), IntermediateStage()])(5)
+
+
+def test_batch_pipeline_consumes_and_produces_once():
+    consumed_results = []
+
+    @dataclass
+    class ProduceAndBatchStage(PipelineStage[int, int]):
+        def produce(self) -> Iterable[int]:
+            return [-1]
+
+        def transform_batch(self, inputs: Sequence[int]) -> Sequence[int]:
+            return [x + 1 for x in inputs]
+
+        def consume(self, x: int) -> None:
+            consumed_results.append(x)
+
+    pipeline = BatchPipeline[int, int]([RangeStage(), ProduceAndBatchStage()], batch_size=2)
+
+    assert pipeline(5) == [-1, 1, 2, 3, 4, 5]
+    assert consumed_results == [-1, 1, 2, 3, 4, 5]
+
+
+def test_batch_pipeline_stream_is_lazy():
+    stage = BatchDoublingStage()
+    pipeline = BatchPipeline[int, int]([RangeStage(), stage], batch_size=8)
+    results = pipeline.stream(1_000_000)
+
+    assert [next(results) for _ in range(3)] == [0, 2, 4]
+    assert stage.batch_sizes == [8]
+
+
+@dataclass
+class AddOneStage(PipelineStage[int, int]):
+    pure = True
+
+    def transform(self, x: int) -> Iterable[int]:
+        yield x + 1
+
+
+@dataclass
+class TripleStage(PipelineStage[int, int]):
+    pure = True
+
+    def transform_one(self, x: int) -> int:
+        return x * 3
+
+    def transform(self, x: int) -> Iterable[int]:
+        return [self.transform_one(x)]
+
+
+@dataclass
+class PureToStringStage(PipelineStage[int, str]):
+    pure = True
+
+    def transform_one(self, x: int) -> str:
+        return str(x)
+
+    def transform(self, x: int) -> Iterable[str]:
+        return [str(x)]
+
+
+def test_compile_fuses_consecutive_pure_stages():
+    consumed_results = []
+    consuming_stage = CustomStage[int, int](consume=lambda x: consumed_results.append(x))
+    pipeline = Pipeline[int, str]([RangeStage(), AddOneStage(), TripleStage(), consuming_stage, AddOneStage(), TripleStage(), PureToStringStage()])
+    compiled = pipeline.compile()
+
+    assert isinstance(compiled.stages[0], RangeStage)
+    assert isinstance(compiled.stages[1], FusedStage) and len(compiled.stages[1].stages) == 2
+    assert compiled.stages[2] is consuming_stage
+    assert isinstance(compiled.stages[3], FusedStage) and len(compiled.stages[3].stages) == 3
+    assert len(pipeline.stages) == 7, "Compiling should not modify the original pipeline."
+
+    expected = pipeline(5)
+    assert compiled(5) == expected
+    assert list(compiled.stream(5)) == expected
+    assert consumed_results == [3, 6, 9, 12, 15] * 3
+
+
+def test_compile_does_not_fuse_impure_stages():
+    @dataclass
+    class ProducingPureStage(PipelineStage[int, int]):
+        pure = True
+
+        def produce(self) -> Iterable[int]:
+            return [100]
+
+        def transform(self, x: int) -> Iterable[int]:
+            return [x]
+
+    pipeline = Pipeline[int, int]([InitialStage(), AddOneStage(), ProducingPureStage(), InitialStage()])
+
+    assert all(not isinstance(stage, FusedStage) for stage in pipeline.compile().stages)
+
+
+def test_rshift_fuses_pure_stages():
+    combined_stage = AddOneStage() >> TripleStage() >> PureToStringStage()
+
+    assert isinstance(combined_stage, FusedStage)
+    assert len(combined_stage.stages) == 3
+    assert combined_stage(1) == ["6"]
+
+
+def test_fused_stage_can_be_pickled():
+    fused_stage = (AddOneStage() >> TripleStage())
+
+    assert pickle.loads(pickle.dumps(fused_stage))(2) == [9]
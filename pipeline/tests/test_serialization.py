@@ -0,0 +1,50 @@
+import pytest
+from dataclasses import dataclass
+
+import sys
+import pathlib
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent.parent / "generics" / "generics"))
+from pipeline.serialization import JsonCodec, MsgpackCodec, CompressedCodec, get_codec, json_decoder
+
+
+@dataclass
+class Record:
+    id: int
+    text: str
+
+
+RECORDS = [Record(id=i, text="line\nbreak" * i) for i in range(5)]
+
+
+@pytest.mark.parametrize("name", ["json", "msgpack", "json+zlib", "msgpack+zlib", "msgpack+lzma", "json+bz2"])
+def test_codec_round_trips_records(name):
+    codec = get_codec(name)
+    assert codec.name == name
+    assert [codec.decode(codec.encode(record), Record) for record in RECORDS] == RECORDS
+
+
+@pytest.mark.parametrize("name", ["json", "msgpack", "json+zlib"])
+def test_codec_splits_framed_records(name):
+    codec = get_codec(name)
+    segment = b"".join(codec.frame(codec.encode(record)) for record in RECORDS)
+    assert [codec.decode(record, Record) for record in codec.split(segment)] == RECORDS
+
+
+def test_get_codec_builds_compressed_codecs():
+    codec = get_codec("msgpack+zlib")
+    assert isinstance(codec, CompressedCodec) and isinstance(codec.codec, MsgpackCodec)
+    assert codec.extension == ".msgpack.zlib"
+    assert isinstance(get_codec("json"), JsonCodec)
+
+
+@pytest.mark.parametrize("name", ["yaml", "json+snappy", "json+"])
+def test_get_codec_rejects_unknown_codecs(name):
+    with pytest.raises(ValueError):
+        get_codec(name)
+
+
+def test_typed_decoders_are_shared_across_codecs():
+    assert json_decoder(Record) is json_decoder(Record)
+    assert get_codec("json").decoder(Record).__self__ is get_codec("json").decoder(Record).__self__
+    assert get_codec("msgpack").decoder(Record).__self__ is get_codec("msgpack").decoder(Record).__self__